@@ -1,192 +1,444 @@
+import time
+LAUNCH_TIME = time.perf_counter()  # reference point for the time-to-first-frame report
+
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog, ttk
+import argparse
 import os
-import random
-import pickle
-import pygame
-from pygame import mixer
-import time
-
-# ===================== Initialize pygame =====================
-pygame.init()
-mixer.init()
-
-# ===================== Song, PlaylistNode, Playlist Classes =====================
-class Song:
-    """Represents a song with metadata"""
-    def __init__(self, filepath):
-        self.filepath = filepath
-        self.filename = os.path.basename(filepath)
-        self.title = os.path.splitext(self.filename)[0]
-        self.artist = "Unknown Artist"
-        self.duration = self._get_duration()
-        self.album = "Unknown Album"
-
-    def _get_duration(self):
-        """Get song duration using pygame (fallback 180s)"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from playlist_engine import (
+    IMPORT_WORKERS, DuplicateFinder, ImportJob, LibraryIndex, LoudnessAnalyzer, Playlist, PlaylistNode, PlaylistStore,
+    Prefetcher, SearchIndex, SimilarityIndex, SmartPlaylist, SmartRules, SongCatalog, metadata_cache, numpy_available,
+    scan_dirs, track_gain,
+)
+from remote_control import REMOTE_PORT, RemoteError, RemoteServer, TkBridge
+
+# ===================== Audio (initialized on first playback) =====================
+pygame = None
+mixer = None
+numpy = None  # only needed for crossfade mixing
+
+def init_audio():
+    """Import pygame and open only what playback needs; a no-op once the mixer is up"""
+    global pygame, mixer
+    if mixer is not None and mixer.get_init():
+        return
+    import pygame as pygame_module
+    pygame = pygame_module  # bound first so callers can catch pygame.error from mixer.init()
+    pygame.mixer.init()
+    try:
+        pygame.display.init()  # SDL keeps the event queue (end-of-track events) in the video subsystem
+    except pygame.error:
+        pass  # PlaybackEvents falls back to polling get_busy()
+    mixer = pygame.mixer
+
+def init_numpy():
+    """Import NumPy for crossfade mixing; False if it is not installed"""
+    global numpy
+    if numpy is None:
         try:
-            sound = pygame.mixer.Sound(self.filepath)
-            duration = sound.get_length()
-            del sound
-            return duration if duration and duration > 0 else 180
-        except Exception:
-            return 180
-
-class PlaylistNode:
-    """Node for doubly-linked list implementation"""
-    def __init__(self, song):
-        self.song = song
-        self.next = None
-        self.prev = None
-
-class Playlist:
-    """Playlist ADT using doubly-linked list"""
-    def __init__(self, name):
-        self.name = name
-        self.head = None
-        self.tail = None
-        self.current = None
-        self.length = 0
-        self.is_shuffled = False
-        self.original_order = []
-        self.shuffle_session = None  # Track played songs in shuffle mode
-
-    def add_song(self, song):
-        """Add song to end of playlist"""
-        new_node = PlaylistNode(song)
-        if not self.head:
-            self.head = self.tail = self.current = new_node
-        else:
-            new_node.prev = self.tail
-            self.tail.next = new_node
-            self.tail = new_node
-        self.length += 1
-        self.original_order.append(new_node)
-
-    def remove_song(self, song_title):
-        """Remove song by title"""
-        current = self.head
-        while current:
-            if current.song.title == song_title:
-                if current.prev:
-                    current.prev.next = current.next
-                else:
-                    self.head = current.next
-                if current.next:
-                    current.next.prev = current.prev
-                else:
-                    self.tail = current.prev
-                if self.current == current:
-                    self.current = current.next if current.next else self.head
-                if current in self.original_order:
-                    self.original_order.remove(current)
-                self.length -= 1
-                return True
-            current = current.next
-        return False
-
-    def move_song(self, song_title, direction):
-        """Move song up or down in playlist (only when not shuffled)"""
-        if self.is_shuffled or self.length <= 1:
+            import numpy as numpy_module
+        except ImportError:
             return False
-        for i, node in enumerate(self.original_order):
-            if node.song.title == song_title:
-                if direction == "up" and i > 0:
-                    self.original_order[i], self.original_order[i-1] = self.original_order[i-1], self.original_order[i]
-                    self._rebuild_linked_list()
-                    return True
-                if direction == "down" and i < len(self.original_order) - 1:
-                    self.original_order[i], self.original_order[i+1] = self.original_order[i+1], self.original_order[i]
-                    self._rebuild_linked_list()
-                    return True
-        return False
-
-    def _rebuild_linked_list(self):
-        """Rebuild the linked list from original_order"""
-        if not self.original_order:
-            self.head = self.tail = self.current = None
-            return
-        current_song = self.current.song if self.current else None
-        for i, node in enumerate(self.original_order):
-            node.prev = self.original_order[i-1] if i > 0 else None
-            node.next = self.original_order[i+1] if i < len(self.original_order)-1 else None
-        self.head = self.original_order[0]
-        self.tail = self.original_order[-1]
-        if current_song:
-            for node in self.original_order:
-                if node.song.title == current_song.title:
-                    self.current = node
-                    break
-        else:
-            self.current = self.head
-
-    def shuffle(self):
-        """Shuffle the playlist order (visual + pointer shuffle)"""
-        if self.length <= 1:
-            return
-        current_song = self.current.song if self.current else None
-        shuffled = self.original_order.copy()
-        random.shuffle(shuffled)
-        for i, node in enumerate(shuffled):
-            node.prev = shuffled[i-1] if i > 0 else None
-            node.next = shuffled[i+1] if i < len(shuffled)-1 else None
-        self.head = shuffled[0]
-        self.tail = shuffled[-1]
-        self.current = self.head
-        if current_song:
-            for node in shuffled:
-                if node.song.title == current_song.title:
-                    self.current = node
-                    break
-        self.is_shuffled = True
-
-    def unshuffle(self):
-        """Restore original order"""
-        if not self.is_shuffled:
+        numpy = numpy_module
+    return True
+
+# ===================== UI Timing =====================
+IMPORT_POLL_MS = 50
+SAVE_DEBOUNCE_MS = 400
+PREFETCH_POLL_MS = 100
+FOLDER_POLL_MS = 5000  # watched-folder rescan interval
+ANALYSIS_POLL_MS = 500
+ANALYSIS_DELAY_MS = 3000  # let startup and the first playlist load finish before spawning analysis workers
+CROSSFADE_FEED_MS = 40     # how often the crossfade player tops up its channel queue
+SMART_REFRESH_MS = 15 * 60 * 1000  # re-check smart playlists with age rules ("added within 30 days")
+REMOTE_POLL_MS = 15  # how often remote-control commands are picked up while the server runs
+PLAYLIST_MEMORY_BUDGET = 50000  # songs kept materialized across playlists before LRU eviction
+
+# ===================== Sort Views =====================
+# Choices of the "Sort" box: (field, descending) pairs for Playlist.sorted_nodes(), most significant first
+QUEUE_ORDER = "Queue order"
+SORT_PRESETS = OrderedDict([
+    (QUEUE_ORDER, ()),
+    ("Title", (('title', False),)),
+    ("Artist, Album", (('artist', False), ('album', False), ('track', False))),
+    ("Album", (('album', False), ('track', False))),
+    ("Duration", (('duration', False),)),
+    ("Date added", (('added', False),)),
+])
+
+# ===================== Song Radio =====================
+RADIO_LOOKAHEAD = 3  # similar songs kept queued after the playing one
+RADIO_SEEDS = 3      # the last songs in the queue that steer the next pick
+
+# ===================== Remote Control =====================
+REMOTE_PAGE_SIZE = 100   # songs per page of /playlists/<name> and /queue unless the client asks
+REMOTE_MAX_PAGE = 1000
+
+# ===================== Virtualized Song List =====================
+class VirtualListbox(tk.Frame):
+    """Listbox look-alike that only draws the rows currently on screen.
+
+    Row text is pulled on demand through fetch_rows(first, count) -> [text, ...],
+    so redraws, scrolling and single-row updates cost O(visible rows) no matter
+    how long the list is. Supports the subset of the tk.Listbox API the app uses.
+    """
+    def __init__(self, master, fetch_rows, font=('Helvetica', 10), row_height=22,
+                 bg='white', fg='black', selectbackground='blue', selectforeground='white'):
+        super().__init__(master, bg=bg)
+        self.fetch_rows = fetch_rows
+        self.font = font
+        self.row_height = row_height
+        self.bg, self.fg = bg, fg
+        self.select_bg, self.select_fg = selectbackground, selectforeground
+        self.count = 0
+        self.top = 0
+        self.selected = set()
+        self.anchor = None  # row a shift-click extends the selection from
+        self.row_items = []  # pooled (rect_id, text_id) per on-screen row
+
+        self.canvas = tk.Canvas(self, bg=bg, highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind('<Configure>', lambda e: self.redraw())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<Control-Button-1>', lambda e: self._on_click(e, toggle=True))
+        self.canvas.bind('<Shift-Button-1>', lambda e: self._on_click(e, extend=True))
+        self.canvas.bind('<Control-a>', lambda e: self.selection_set(0, self.count - 1))
+        self.canvas.bind('<MouseWheel>', lambda e: self.yview('scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.canvas.bind('<Button-4>', lambda e: self.yview('scroll', -3, 'units'))
+        self.canvas.bind('<Button-5>', lambda e: self.yview('scroll', 3, 'units'))
+
+    # --- Listbox-compatible API ---
+    def bind(self, sequence=None, func=None, add=None):
+        return self.canvas.bind(sequence, func, add)
+
+    def size(self):
+        return self.count
+
+    def get(self, index):
+        rows = self.fetch_rows(index, 1) if 0 <= index < self.count else []
+        return rows[0] if rows else ''
+
+    def curselection(self):
+        return tuple(sorted(self.selected))
+
+    def selection_clear(self, first=0, last=None):
+        if self.selected:
+            self.selected.clear()
+            self.redraw()
+
+    def selection_set(self, index, last=None):
+        last = index if last is None else min(last, self.count - 1)
+        if 0 <= index <= last:
+            self.selected.update(range(index, last + 1))
+            self._redraw_if_visible(index, last)
+
+    def see(self, index):
+        full_rows = self._full_rows()
+        if index < self.top:
+            self._scroll_to(index)
+        elif index >= self.top + full_rows:
+            self._scroll_to(index - full_rows + 1)
+
+    def yview(self, *args):
+        if not args:
+            return self._fractions()
+        if args[0] == 'moveto':
+            self._scroll_to(int(float(args[1]) * self.count))
+        elif args[0] == 'scroll':
+            step = max(1, self._full_rows() - 1) if args[2] == 'pages' else 1
+            self._scroll_to(self.top + int(args[1]) * step)
+
+    # --- Targeted updates ---
+    def set_count(self, count):
+        """The source changed size (or was replaced): clamp the view and redraw"""
+        self.count = count
+        self.selected = {row for row in self.selected if row < count}
+        self.top = max(0, min(self.top, count - self._full_rows()))
+        self.redraw()
+
+    def insert_rows(self, index, n=1):
+        self.count += n
+        self.selected = {row + n if row >= index else row for row in self.selected}
+        if index < self.top:
+            self.top += n  # keep the same rows on screen
+        self._redraw_if_visible(index, self.count)
+
+    # --- Drawing ---
+    def _full_rows(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def _fractions(self):
+        if not self.count:
+            return (0.0, 1.0)
+        return (self.top / self.count, min(1.0, (self.top + self._full_rows()) / self.count))
+
+    def _scroll_to(self, top):
+        top = max(0, min(top, self.count - self._full_rows()))
+        if top != self.top:
+            self.top = top
+            self.redraw()
+
+    def _redraw_if_visible(self, first, last=None):
+        last = first if last is None else last
+        if first <= self.top + self._full_rows() and last >= self.top:
+            self.redraw()
+
+    def redraw(self):
+        visible = self._full_rows() + 1
+        texts = self.fetch_rows(self.top, min(visible, self.count - self.top)) if self.count > self.top else []
+        width = self.canvas.winfo_width()
+        h = self.row_height
+        while len(self.row_items) < len(texts):
+            rect = self.canvas.create_rectangle(0, 0, 0, 0, outline='', fill=self.bg)
+            text = self.canvas.create_text(6, 0, anchor='w', font=self.font, fill=self.fg)
+            self.row_items.append((rect, text))
+        for i, (rect, text) in enumerate(self.row_items):
+            if i >= len(texts):
+                self.canvas.itemconfig(rect, state='hidden')
+                self.canvas.itemconfig(text, state='hidden')
+                continue
+            selected = (self.top + i) in self.selected
+            self.canvas.coords(rect, 0, i * h, width, (i + 1) * h)
+            self.canvas.itemconfig(rect, state='normal', fill=self.select_bg if selected else self.bg)
+            self.canvas.coords(text, 6, i * h + h // 2)
+            self.canvas.itemconfig(text, state='normal', text=texts[i],
+                                   fill=self.select_fg if selected else self.fg)
+        self.scrollbar.set(*self._fractions())
+
+    def _on_click(self, event, toggle=False, extend=False):
+        """Plain click selects one row; Ctrl+click toggles a row; Shift+click selects a range"""
+        row = self.top + int(event.y // self.row_height)
+        if not 0 <= row < self.count:
             return
-        self._rebuild_linked_list()
-        self.is_shuffled = False
-
-    def get_song_list(self):
-        """Get list of song titles in current linked-list order"""
-        songs = []
-        current = self.head
-        while current:
-            songs.append(current.song.title)
-            current = current.next
-        return songs
-
-    def play_next(self):
-        """Move to next song (or random unplayed when shuffled)"""
-        if not self.current:
-            return None
-        if self.is_shuffled:
-            if self.shuffle_session is None or len(self.shuffle_session) == self.length:
-                self.shuffle_session = []
-            unplayed = [node for node in self.original_order if node not in self.shuffle_session]
-            if not unplayed:
-                self.shuffle_session = []
-                unplayed = self.original_order.copy()
-            next_node = random.choice(unplayed)
-            self.shuffle_session.append(next_node)
-            self.current = next_node
+        if extend and self.anchor is not None:
+            anchor = min(self.anchor, self.count - 1)
+            self.selected = set(range(min(anchor, row), max(anchor, row) + 1))
+        elif toggle:
+            self.selected ^= {row}
+            self.anchor = row
         else:
-            self.current = self.current.next if self.current.next else self.head
-        return self.current.song
+            self.selected = {row}
+            self.anchor = row
+        self.redraw()
+        self.canvas.focus_set()
+
+# ===================== Playback Events =====================
+class PlaybackEvents:
+    """Bridges mixer end-of-track events into the Tk loop.
+
+    The mixer posts end_event on the pygame queue when a track finishes;
+    the app drains it on its (sparse) progress ticks instead of polling
+    get_busy() five times a second. Falls back to get_busy() if the event
+    queue is unavailable.
+    """
+    def __init__(self):
+        self.use_events = True
+        self.end_event = pygame.USEREVENT + 1
+        mixer.music.set_endevent(self.end_event)
+
+    def discard(self):
+        """Forget end events caused by a deliberate stop or load"""
+        if self.use_events:
+            try:
+                pygame.event.clear(self.end_event)
+            except pygame.error:
+                self.use_events = False
 
-    def play_previous(self):
-        """Move to previous song (queue mode only)"""
-        if not self.current:
+    def track_ended(self):
+        if self.use_events:
+            try:
+                return bool(pygame.event.get(self.end_event))
+            except pygame.error:
+                self.use_events = False
+        return not mixer.music.get_busy()
+
+# ===================== Crossfade Playback =====================
+CROSSFADE_BLOCK_FRAMES = 16384  # ~0.37 s at 44.1 kHz; one block plays while the next waits in the queue
+CROSSFADE_RING = 3              # reused block buffers: playing, queued, and the one being mixed
+MAX_CROSSFADE_S = 12
+
+class DecodedTrack:
+    """A song decoded to 16-bit PCM in memory, streamed out block by block"""
+    def __init__(self, song, gain=1.0):
+        self.song = song
+        self.sound = pygame.mixer.Sound(song.filepath)  # owns the samples
+        samples = pygame.sndarray.samples(self.sound)   # view, no copy
+        if not len(samples):
+            raise pygame.error("No audio in file")
+        self.samples = samples.reshape(len(samples), -1)
+        self.gain = gain
+        self.pos = 0
+
+    @property
+    def remaining(self):
+        return len(self.samples) - self.pos
+
+class CrossfadePlayer:
+    """Streams decoded tracks through one reserved mixer channel and crossfades between them.
+
+    fill() mixes fixed-size blocks into a ring of preallocated Sounds and
+    keeps one queued behind the playing one. During a fade the outgoing and
+    incoming tracks are summed under equal-power gain curves. Steady-state
+    mixing writes into the same float scratch buffer and Sound buffers, so
+    no sample buffers are allocated per block.
+    """
+    def __init__(self, fade_seconds, on_advance, on_end):
+        self.on_advance = on_advance  # called with the incoming DecodedTrack when it starts
+        self.on_end = on_end          # called once the last track has finished playing
+        self.rate, _, channels = mixer.get_init()
+        mixer.set_reserved(1)
+        self.channel = mixer.Channel(0)
+        self.ring = [mixer.Sound(buffer=bytes(CROSSFADE_BLOCK_FRAMES * channels * 2)) for _ in range(CROSSFADE_RING)]
+        self.ring_views = [pygame.sndarray.samples(sound).reshape(CROSSFADE_BLOCK_FRAMES, -1) for sound in self.ring]
+        self.slot = 0
+        self.mix = numpy.zeros((CROSSFADE_BLOCK_FRAMES, channels), numpy.float32)
+        self.scratch = numpy.zeros_like(self.mix)
+        self.outgoing = None  # track fading out
+        self.current = None   # track playing (fading in while outgoing is set)
+        self.upcoming = None  # decoded next track, waiting for its turn
+        self.fade_pos = 0
+        self.paused = False
+        self.draining = False  # the last block has been queued; waiting for the channel to finish
+        self.set_fade(fade_seconds)
+
+    def set_fade(self, seconds):
+        """Fade length for the next transitions (0 = gapless cut)"""
+        self.fade_frames = int(max(0.0, seconds) * self.rate)
+        self.curves = self._curves(self.fade_frames)
+
+    def _curves(self, frames):
+        """(fade_out, fade_in) equal-power curves of `frames`, padded by a block of 0s / 1s"""
+        t = numpy.linspace(0, numpy.pi / 2, frames, dtype=numpy.float32)
+        pad = numpy.zeros(CROSSFADE_BLOCK_FRAMES, numpy.float32)
+        return (numpy.concatenate([numpy.cos(t), pad])[:, None],
+                numpy.concatenate([numpy.sin(t), pad + 1])[:, None])
+
+    @property
+    def active(self):
+        return self.current is not None
+
+    def play(self, track):
+        """Start a track now, dropping whatever was playing"""
+        self.channel.stop()
+        self.outgoing, self.current, self.upcoming = None, track, None
+        self.paused = self.draining = False
+        self.fill()
+
+    def set_upcoming(self, track):
+        self.upcoming = track
+        self.draining = False
+
+    def pause(self):
+        self.paused = True
+        self.channel.pause()
+
+    def resume(self):
+        self.paused = False
+        self.channel.unpause()
+        self.fill()
+
+    def stop(self):
+        self.channel.stop()
+        self.outgoing = self.current = self.upcoming = None
+        self.paused = self.draining = False
+
+    def set_volume(self, volume):
+        self.channel.set_volume(volume)
+
+    def seek(self, seconds):
+        """Continue the current track from `seconds`, dropping the queued blocks and any fade in progress"""
+        self.channel.stop()
+        self.outgoing = None
+        self.current.pos = max(0, min(int(seconds * self.rate), len(self.current.samples)))
+        self.draining = False
+        self.fill()
+
+    def fill(self):
+        """Top up the channel: something playing and one block queued behind it"""
+        if self.current is None or self.paused:
+            return
+        while self.channel.get_queue() is None:
+            if self.draining:
+                if not self.channel.get_busy():
+                    self.stop()
+                    self.on_end()
+                return
+            block = self._render()
+            if block is None:
+                return
+            if self.channel.get_busy():
+                self.channel.queue(block)
+            else:
+                self.channel.play(block)
+
+    def _render(self):
+        """Mix the next block into the next ring Sound and return it (None if nothing is left to mix)"""
+        mix = self.mix
+        mix.fill(0)
+        filled = 0
+        while filled < CROSSFADE_BLOCK_FRAMES:
+            fade_at = min(self.fade_frames, len(self.upcoming.samples)) if self.upcoming is not None else 0
+            if self.outgoing is None and self.upcoming is not None and self.current.remaining <= fade_at:
+                self._begin_fade()
+                if self.current is None:
+                    return None
+            if self.current.remaining == 0:
+                if self.upcoming is None:
+                    self.draining = True
+                    break
+                self.outgoing, self.current, self.upcoming = None, self.upcoming, None
+                self.on_advance(self.current)
+                if self.current is None:
+                    return None  # the callback stopped playback
+                continue
+            n = min(CROSSFADE_BLOCK_FRAMES - filled, self.current.remaining)
+            if self.outgoing is None and self.upcoming is not None:
+                n = min(n, self.current.remaining - fade_at)  # stop exactly where the fade begins
+            if self.outgoing is not None:
+                n = min(n, self.outgoing.remaining)
+                fade_out, fade_in = self.fade_curves
+                self._add(self.outgoing, filled, n, fade_out[self.fade_pos:self.fade_pos + n])
+                self._add(self.current, filled, n, fade_in[self.fade_pos:self.fade_pos + n])
+                self.fade_pos += n
+                if self.outgoing.remaining == 0:
+                    self.outgoing = None
+            else:
+                self._add(self.current, filled, n)
+            filled += n
+        if not filled:
             return None
-        if self.is_shuffled:
-            return self.play_next()
-        else:
-            self.current = self.current.prev if self.current.prev else self.tail
-        return self.current.song
+        sound = self.ring[self.slot]
+        numpy.clip(mix, -32768, 32767, out=mix)
+        numpy.copyto(self.ring_views[self.slot], mix, casting='unsafe')
+        self.slot = (self.slot + 1) % CROSSFADE_RING
+        return sound
+
+    def _add(self, track, offset, n, curve=None):
+        """mix[offset:offset + n] += the track's next n frames x its gain (x the fade curve)"""
+        out = self.scratch[:n]
+        numpy.multiply(track.samples[track.pos:track.pos + n], track.gain, out=out)
+        if curve is not None:
+            out *= curve
+        self.mix[offset:offset + n] += out
+        track.pos += n
+
+    def _begin_fade(self):
+        self.outgoing, self.current, self.upcoming = self.current, self.upcoming, None
+        frames = min(self.fade_frames, self.outgoing.remaining, len(self.current.samples))
+        # Curves are only rebuilt when a short track forces a shorter fade
+        self.fade_curves = self.curves if frames == self.fade_frames else self._curves(frames)
+        self.fade_pos = 0
+        self.on_advance(self.current)
 
 # ===================== Music Player App (Colorful UI + Full Functionality) =====================
 class MusicPlayerApp:
-    def __init__(self, root):
+    def __init__(self, root, remote_port=None, remote_socket=None):
         self.root = root
         self.root.title("🎵 Music Playlist Management System")
         self.root.geometry("900x680")
@@ -203,10 +455,55 @@ class MusicPlayerApp:
 
         self.root.configure(bg=self.COL_BG)
 
-        # Playlist manager
+        # Playlist manager (values are None until a playlist is first viewed or played)
         self.playlists = {}
+        self.playlist_info = {}  # name -> {'count', 'is_shuffled'} for playlists not in memory
+        self.recent_playlists = OrderedDict()  # materialized playlist names, least recently used first
         self.current_playlist = None
 
+        # Storage + the shared song catalog (one Song per file across all playlists)
+        self.store = None
+        self.save_scheduled = False
+        self.catalog = SongCatalog()
+
+        # Search across all playlists (stored entries are indexed on the first query)
+        self.search_index = SearchIndex()
+        self.search_store_indexed = False
+        self.search_results = None  # node ids shown in the list while a query is active
+        self.pending_play = None    # search hit to play once its playlist has loaded
+
+        # Background import
+        self.import_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS)
+        self.import_jobs = []
+        self.import_poll_scheduled = False
+
+        # Sorted view of the current playlist (display only until applied to the queue)
+        self.sort_reversed = False
+
+        # Watched folders: rescanned in the background, one stat() per directory
+        self.folder_scan = None
+        self.folder_poll_job = None
+        self.duplicate_finder = None
+
+        # Loudness analysis of the library, on a process pool in the background
+        self.loudness = None
+        self.loudness_rerun = False
+
+        # Radio: tops the queue up with the library's nearest neighbours of the songs at its end
+        self.radio_on = False
+        self.radio_index = None  # SimilarityIndex over the analyzed library
+        self.radio_build = None  # future building a fresh index on the import pool
+        self.radio_stale = True  # new analysis results since radio_index was built
+        self.radio_job = None    # ImportJob adding the latest picks
+
+        # Smart playlists: rules evaluated against an in-memory index of the library's attributes
+        self.smart_rules = {}       # smart playlist name -> SmartRules
+        self.library = None         # LibraryIndex, built in the background on first use
+        self.library_build = None   # future building it
+        self.library_backlog = []   # changes that arrived while it was being built, replayed afterwards
+        self.tag_reads = []         # futures re-reading tags of files a rescan found new or changed
+        self.played_song = None     # playing song; its play is counted once playback moves past it
+
         # Playback state
         self.is_playing = False
         self.is_paused = False
@@ -220,14 +517,36 @@ class MusicPlayerApp:
         self.move_down_btn = None
         self.shuffle_btn = None
         self.order_btn = None
+        self.radio_btn = None
 
-        # Styles + Data + UI
+        # Styles + UI; playlists are read once the window is on screen
         self._configure_styles()
-        self._load_playlists()
         self._create_widgets()
-
-        # Progress updater
-        self._update_progress()
+        self.first_frame_ms = None
+        self.root.after_idle(self._finish_startup)
+
+        # Progress updater: only scheduled while a song is actually playing
+        self.playback_events = None  # created with the mixer on first playback
+        self.progress_job = None
+        self.shown_second = None
+
+        # Gapless: the upcoming track is prefetched, then handed to mixer.music.queue
+        self.prefetcher = Prefetcher()
+        self.prefetch = None      # (song, future) for the upcoming track
+        self.queued_song = None   # song currently sitting in the mixer queue
+
+        # Crossfade: songs are decoded on the prefetch thread and mixed by a CrossfadePlayer
+        self.crossfader = None    # created on the first crossfaded play
+        self.crossfade_job = None
+        self.decoding = None      # (song, future) being decoded to start playing
+        self.decoding_remote = False  # that play came from a remote client, which has had its reply already
+        self.decoded = None       # (song, future) for the upcoming track, decoded ahead of its fade
+
+        # Remote control: a local HTTP/JSON server started once the playlists are loaded
+        self.remote_address = (remote_port, remote_socket)
+        self.remote = None         # RemoteServer
+        self.remote_bridge = None  # TkBridge whose commands run from _poll_remote
+        self.remote_command = False  # set while they run: errors go back to the client instead of a dialog
 
         # Close handling
         self.root.protocol("WM_DELETE_WINDOW", self._on_close)
@@ -281,26 +600,42 @@ class MusicPlayerApp:
 
         ttk.Button(playlist_controls, text="New", style='Accent.TButton', command=self._create_playlist)\
             .pack(side=tk.LEFT, padx=4)
+        ttk.Button(playlist_controls, text="Smart", style='Accent.TButton', command=self._create_smart_playlist)\
+            .pack(side=tk.LEFT, padx=4)
         ttk.Button(playlist_controls, text="Delete", style='Danger.TButton', command=self._delete_playlist)\
             .pack(side=tk.LEFT, padx=4)
+        ttk.Button(playlist_controls, text="Watch Folder", style='Warn.TButton', command=self._watch_folder)\
+            .pack(side=tk.LEFT, padx=4)
+        ttk.Button(playlist_controls, text="Duplicates", style='Warn.TButton', command=self._find_duplicates)\
+            .pack(side=tk.LEFT, padx=4)
 
         # --- Middle: Song list + controls ---
         middle_card = ttk.Frame(self.root, style='Card.TFrame', padding=10)
         middle_card.pack(fill=tk.BOTH, expand=True, padx=12, pady=6)
 
+        # Search box
+        search_frame = tk.Frame(middle_card, bg=self.COL_CARD)
+        search_frame.pack(fill=tk.X, pady=(0, 8))
+        tk.Label(search_frame, text="Search:", bg=self.COL_CARD, fg=self.COL_TEXT,
+                 font=('Helvetica', 10, 'bold')).pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', lambda *args: self._update_song_list())
+        search_entry = tk.Entry(search_frame, textvariable=self.search_var, bg=self.COL_BG, fg=self.COL_TEXT,
+                                insertbackground=self.COL_TEXT, relief=tk.FLAT, font=('Helvetica', 10))
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
+        search_entry.bind("<Return>", lambda e: self._play_song())
+        search_entry.bind("<Escape>", lambda e: self.search_var.set(""))
+
         # Song list
         list_frame = tk.Frame(middle_card, bg=self.COL_CARD)
         list_frame.pack(fill=tk.BOTH, expand=True)
 
-        self.song_listbox = tk.Listbox(list_frame, selectmode=tk.SINGLE, font=('Helvetica', 10),
-                                       activestyle='none', bg=self.COL_BG, fg=self.COL_TEXT,
-                                       selectbackground=self.COL_ACCENT, selectforeground='#0B1220')
+        self.song_listbox = VirtualListbox(list_frame, self._fetch_song_rows, font=('Helvetica', 10),
+                                           bg=self.COL_BG, fg=self.COL_TEXT,
+                                           selectbackground=self.COL_ACCENT, selectforeground='#0B1220')
         self.song_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.song_listbox.bind("<Double-Button-1>", lambda e: self._play_song())
-
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.song_listbox.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.song_listbox.config(yscrollcommand=scrollbar.set)
+        self.song_listbox.bind("<Delete>", lambda e: self._remove_song())
 
         # Song management buttons
         song_controls = tk.Frame(middle_card, bg=self.COL_CARD)
@@ -310,6 +645,14 @@ class MusicPlayerApp:
             .pack(side=tk.LEFT, padx=4)
         ttk.Button(song_controls, text="Remove", style='Danger.TButton', command=self._remove_song)\
             .pack(side=tk.LEFT, padx=4)
+        self.move_up_btn = ttk.Button(song_controls, text="▲", width=3, style='Accent.TButton',
+                                      command=lambda: self._move_song('up'))
+        self.move_up_btn.pack(side=tk.LEFT, padx=4)
+        self.move_down_btn = ttk.Button(song_controls, text="▼", width=3, style='Accent.TButton',
+                                        command=lambda: self._move_song('down'))
+        self.move_down_btn.pack(side=tk.LEFT, padx=4)
+        ttk.Button(song_controls, text="Dedupe", style='Warn.TButton', command=self._dedupe_playlist)\
+            .pack(side=tk.LEFT, padx=4)
 
         self.order_btn = ttk.Button(song_controls, text="Order: ON", style='Accent.TButton',
                                     command=self._toggle_order)
@@ -318,6 +661,20 @@ class MusicPlayerApp:
         self.shuffle_btn = ttk.Button(song_controls, text="Shuffle: OFF", style='Accent.TButton',
                                       command=self._toggle_shuffle)
         self.shuffle_btn.pack(side=tk.LEFT, padx=4)
+        self.radio_btn = ttk.Button(song_controls, text="Radio: OFF", style='Accent.TButton',
+                                    command=self._toggle_radio)
+        self.radio_btn.pack(side=tk.LEFT, padx=4)
+
+        self.sort_var = tk.StringVar(value=QUEUE_ORDER)
+        sort_box = ttk.Combobox(song_controls, textvariable=self.sort_var, values=list(SORT_PRESETS),
+                                state='readonly', width=14, style='Custom.TCombobox')
+        sort_box.pack(side=tk.LEFT, padx=(12, 4))
+        sort_box.bind("<<ComboboxSelected>>", lambda e: self._update_song_list())
+        self.reverse_btn = ttk.Button(song_controls, text="↑", width=3, style='Accent.TButton',
+                                      command=self._toggle_sort_direction)
+        self.reverse_btn.pack(side=tk.LEFT, padx=4)
+        ttk.Button(song_controls, text="Apply Order", style='Warn.TButton', command=self._apply_sort)\
+            .pack(side=tk.LEFT, padx=4)
 
         # --- Playback Controls ---
         controls_card = ttk.Frame(self.root, style='Card.TFrame', padding=10)
@@ -355,10 +712,17 @@ class MusicPlayerApp:
 
         tk.Label(volume_card, text="🔈", bg=self.COL_CARD, fg=self.COL_TEXT, font=('Helvetica', 12))\
             .pack(side=tk.LEFT)
-        self.volume_var = tk.DoubleVar(value=0.7)
-        mixer.music.set_volume(self.volume_var.get())
+        self.volume_var = tk.DoubleVar(value=0.7)  # applied when the mixer starts
         ttk.Scale(volume_card, from_=0, to=1, variable=self.volume_var, command=self._set_volume, length=180)\
             .pack(side=tk.LEFT, padx=8)
+        self.normalize_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(volume_card, text="Normalize loudness", variable=self.normalize_var,
+                        command=self._apply_volume).pack(side=tk.LEFT, padx=8)
+        tk.Label(volume_card, text="Crossfade (s)", bg=self.COL_CARD, fg=self.COL_TEXT, font=('Helvetica', 10))\
+            .pack(side=tk.LEFT, padx=(8, 4))
+        self.crossfade_var = tk.DoubleVar(value=0)  # 0 = gapless, no fade
+        ttk.Spinbox(volume_card, from_=0, to=MAX_CROSSFADE_S, increment=1, width=4, textvariable=self.crossfade_var,
+                    command=self._set_crossfade).pack(side=tk.LEFT)
 
         # --- Now Playing ---
         now_card = ttk.Frame(self.root, style='Card.TFrame', padding=10)
@@ -372,11 +736,21 @@ class MusicPlayerApp:
                                         font=('Helvetica', 10), anchor='w')
         self.song_info_label.pack(fill=tk.X)
 
-        # --- Status Bar ---
+        # --- Status Bar + Import Progress ---
+        status_frame = tk.Frame(self.root, bg=self.COL_BG)
+        status_frame.pack(fill=tk.X, padx=12, pady=(0, 8))
+
         self.status_var = tk.StringVar(value="Ready")
-        status_bar = tk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W,
+        status_bar = tk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W,
                               font=('Helvetica', 9), bg=self.COL_BG, fg=self.COL_MUTED)
-        status_bar.pack(fill=tk.X, padx=12, pady=(0, 8))
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.import_cancel_btn = ttk.Button(status_frame, text="Cancel", style='Danger.TButton',
+                                            command=self._cancel_imports)
+        self.import_progress_var = tk.DoubleVar()
+        self.import_progress = ttk.Progressbar(status_frame, variable=self.import_progress_var, maximum=100,
+                                               length=160, style='custom.Horizontal.TProgressbar',
+                                               mode='determinate')
 
         # Populate playlists
         self._update_playlist_dropdown()
@@ -391,7 +765,9 @@ class MusicPlayerApp:
             if name in self.playlists:
                 messagebox.showwarning("Duplicate Name", "Playlist with this name already exists")
                 return
-            self.playlists[name] = Playlist(name)
+            self.playlists[name] = Playlist(name, self.search_index)
+            self.recent_playlists[name] = None
+            self.store.create_playlist(name)
             self.current_playlist = name
             self._update_playlist_dropdown()
             self._update_song_list()
@@ -406,6 +782,11 @@ class MusicPlayerApp:
             if self.is_playing:
                 self._stop_song()
             del self.playlists[self.current_playlist]
+            self.smart_rules.pop(self.current_playlist, None)
+            self.playlist_info.pop(self.current_playlist, None)
+            self.recent_playlists.pop(self.current_playlist, None)
+            self.search_index.remove_playlist(self.current_playlist)
+            self.store.delete_playlist(self.current_playlist)
             self.current_playlist = None
             self._update_playlist_dropdown()
             self._update_song_list()
@@ -417,10 +798,51 @@ class MusicPlayerApp:
         selected = self.playlist_var.get()
         if selected in self.playlists:
             self.current_playlist = selected
+            playlist = self._get_playlist(selected)
             self._update_song_list()
             self._update_move_buttons_state()
             self._update_shuffle_button_state()
-            self.status_var.set(f"Selected playlist: {selected}")
+            if selected in self.smart_rules:
+                # Its songs are still being matched if the library index isn't built yet, so no count
+                self.status_var.set(f"Selected smart playlist: {selected} | {playlist.rules.text}")
+                return
+            count = self.playlist_info[selected]['count'] if selected in self.playlist_info else playlist.length
+            self.status_var.set(f"Selected playlist: {selected} ({count} songs)")
+
+    def _get_playlist(self, name):
+        """Return a playlist, materializing it from the store on first use"""
+        playlist = self.playlists[name]
+        if playlist is None and name in self.smart_rules:
+            playlist = self.playlists[name] = SmartPlaylist(name, self.smart_rules[name], self.library)
+            self._fill_smart_playlist(playlist)
+        elif playlist is None:
+            info = self.playlist_info[name]
+            playlist = self.playlists[name] = Playlist(name, self.search_index)
+            entries = self.store.entries(name)
+            # Nodes, Song objects and path checks are built in the background as the list fills in
+            self._start_import([path for _, _, path in entries], name, 'load', info['is_shuffled'],
+                               [entry_id for entry_id, _, _ in entries], [song_id for _, song_id, _ in entries])
+        self.recent_playlists[name] = None
+        self.recent_playlists.move_to_end(name)
+        self._evict_playlists()
+        return playlist
+
+    def _evict_playlists(self):
+        """Drop least recently used playlists from memory while over PLAYLIST_MEMORY_BUDGET"""
+        loading = {job.playlist_name for job in self.import_jobs}
+        total = sum(self.playlists[name].length for name in self.recent_playlists)
+        for name in list(self.recent_playlists):
+            if total <= PLAYLIST_MEMORY_BUDGET:
+                break
+            if name == self.current_playlist or name in loading:
+                continue
+            playlist = self.playlists[name]
+            # Every mutation is already queued on the store, so the playlist can be rebuilt later
+            self._flush_store()
+            self.playlist_info[name] = {'count': playlist.length, 'is_shuffled': playlist.is_shuffled}
+            self.playlists[name] = None
+            del self.recent_playlists[name]
+            total -= playlist.length
 
     def _update_playlist_dropdown(self):
         self.playlist_dropdown['values'] = list(self.playlists.keys())
@@ -438,76 +860,584 @@ class MusicPlayerApp:
         if not self.current_playlist:
             messagebox.showwarning("No Playlist", "Please create or select a playlist first")
             return
+        if self._refuse_smart_edit():
+            return
         filepaths = filedialog.askopenfilenames(
             title="Select Songs",
             filetypes=[("Audio Files", "*.mp3 *.wav *.ogg")]
         )
         if filepaths:
-            added = 0
-            for path in filepaths:
-                try:
-                    if os.path.exists(path):
-                        song = Song(path)
-                        self.playlists[self.current_playlist].add_song(song)
-                        added += 1
-                    else:
-                        messagebox.showwarning("File Not Found", f"File not found: {path}")
-                except Exception as e:
-                    messagebox.showerror("Error", f"Could not add {path}:\n{str(e)}")
-            if added > 0:
+            # With a selection in queue order, the new songs go right after it; otherwise at the end
+            selected = self.song_listbox.curselection()
+            insert_at = None
+            if selected and self.search_results is None and not self._sort_spec():
+                insert_at = selected[-1] + 1
+            self._start_import(filepaths, self.current_playlist, 'add', song_ids=self.store.song_ids(filepaths),
+                               insert_at=insert_at)
+            self.status_var.set(f"Importing {len(filepaths)} song(s) into {self.current_playlist}...")
+
+    # ---------- Background Import ----------
+    def _start_import(self, paths, playlist_name, kind, is_shuffled=False, node_ids=None, song_ids=None,
+                      insert_at=None):
+        job = ImportJob(self.import_executor, paths, playlist_name, kind, is_shuffled, node_ids,
+                        song_ids, self.catalog, insert_at)
+        self.import_jobs.append(job)
+        if not self.import_poll_scheduled:
+            self.import_poll_scheduled = True
+            self.root.after(IMPORT_POLL_MS, self._poll_imports)
+        return job
+
+    def _poll_imports(self):
+        self.import_poll_scheduled = False
+        visible_changed = False
+        for job in list(self.import_jobs):
+            playlist = self.playlists.get(job.playlist_name)
+            songs = job.drain()
+            if playlist is None:
+                job.cancel()
+            elif songs:
+                self._update_library(lambda library, songs=songs: [song.song_id for song, _ in songs
+                                                                   if library.set_song(song)])
+                if job.kind == 'add':
+                    # Each drained batch goes in as one block: one relink, one store write
+                    index = playlist.length if job.insert_at is None else min(job.insert_at, playlist.length)
+                    nodes = playlist.insert_songs(index, [song for song, _ in songs])
+                    if job.insert_at is not None:
+                        job.insert_at = index + len(nodes)
+                    self.store.insert_entries(job.playlist_name, nodes)
+                    self._save_playlists()
+                else:
+                    for song, node_id in songs:
+                        playlist.add_song(song, node_id)
+                if job.playlist_name == self.current_playlist:
+                    visible_changed = True
+            if playlist is not None and self.pending_play in playlist.nodes:
+                self._play_search_hit(self.pending_play)
+            if job.finished:
+                self.import_jobs.remove(job)
+                self._finish_import(job, playlist)
+        if visible_changed:
+            self._update_song_list()
+        self._update_import_progress()
+        if self.import_jobs:
+            self.import_poll_scheduled = True
+            self.root.after(IMPORT_POLL_MS, self._poll_imports)
+
+    def _finish_import(self, job, playlist):
+        self._save_metadata_cache()
+        if playlist is None:
+            return
+        if job.kind == 'load':
+            self.playlist_info.pop(job.playlist_name, None)
+            if self.pending_play is not None and self.search_index.playlist_of(self.pending_play) == job.playlist_name:
+                self.pending_play = None  # the hit's file is missing, so it was never loaded
+                messagebox.showwarning("File Not Found", "That song's file could not be found")
+            if job.is_shuffled:
+                playlist.shuffle()
+                if job.playlist_name == self.current_playlist:
+                    self._update_song_list()
+                    self._update_move_buttons_state()
+                    self._update_shuffle_button_state()
+            return
+        self._save_playlists()
+        self._analyze_loudness()
+        added = job.delivered - len(job.missing) - len(job.errors)
+        verb = "Import cancelled" if job.cancelled else "Added"
+        self.status_var.set(f"{verb}: {added} song(s) in {job.playlist_name}")
+        problems = [f"File not found: {path}" for path in job.missing]
+        problems += [f"Could not add {path}: {e}" for path, e in job.errors]
+        if problems:
+            shown = "\n".join(problems[:10])
+            more = f"\n...and {len(problems) - 10} more" if len(problems) > 10 else ""
+            messagebox.showwarning("Import Problems", f"{len(problems)} file(s) were skipped:\n{shown}{more}")
+
+    # ---------- Watched Folders ----------
+    def _watch_folder(self):
+        folder = filedialog.askdirectory(title="Select Music Folder")
+        if not folder:
+            return
+        folder = os.path.normpath(folder)
+        name = os.path.basename(folder) or folder
+        if name in self.smart_rules:
+            messagebox.showwarning("Smart Playlist", f"'{name}' is a smart playlist; rename it to watch this folder")
+            return
+        if name not in self.playlists:
+            self.playlists[name] = Playlist(name, self.search_index)
+            self.recent_playlists[name] = None
+        self.store.add_folder(folder, name)
+        self.current_playlist = name
+        self._update_playlist_dropdown()
+        self._update_song_list()
+        self.status_var.set(f"Watching {folder}; new files go to playlist '{name}'")
+        self._poll_folders()
+
+    def _poll_folders(self):
+        """Start a background rescan of the watched folders (no-op if none, or one is running)"""
+        self.folder_poll_job = None
+        if self.folder_scan is not None or not self.store:
+            return
+        dirs = self.store.watched_dirs()
+        if not dirs:
+            return
+        self.folder_scan = self.import_executor.submit(scan_dirs, dirs)
+        self.root.after(IMPORT_POLL_MS, self._finish_folder_scan)
+
+    def _finish_folder_scan(self):
+        if not self.folder_scan.done():
+            self.root.after(IMPORT_POLL_MS, self._finish_folder_scan)
+            return
+        scan, self.folder_scan = self.folder_scan, None
+        try:
+            result = self.store.apply_scan(scan.result())
+        except Exception as e:
+            self.status_var.set(f"Folder scan failed: {e}")
+            result = None
+        if result:
+            if result.missing:
+                self._update_library(lambda library: [song_id for song_id in result.missing
+                                                      if library.remove(song_id)])
+            if result.touched:
+                self._read_tags(result.touched)
+            for song_id, path in result.moved:
+                song = self.catalog.songs.get(song_id)
+                if song is not None:
+                    song.filepath = path
+            by_playlist = {}
+            for name, song_id, path in result.added:
+                by_playlist.setdefault(name, []).append((song_id, path))
+            loading = {job.playlist_name for job in self.import_jobs if job.kind == 'load'}
+            for name, songs in by_playlist.items():
+                if name not in self.playlists:
+                    self.playlists[name] = None
+                    self.playlist_info[name] = {'count': 0, 'is_shuffled': False}
+                    self._update_playlist_dropdown()
+                if self.playlists[name] is not None and name not in loading:
+                    self._start_import([path for _, path in songs], name, 'add',
+                                       song_ids=[song_id for song_id, _ in songs])
+                else:
+                    # Not in memory: write the entries only; they show up when the playlist is opened
+                    for song_id, _ in songs:
+                        self.store.append_entry(name, song_id)
+                    if name in self.playlist_info:
+                        self.playlist_info[name]['count'] += len(songs)
+            self._save_playlists()
+            self.status_var.set(f"Library updated: {len(result.added)} new, {len(result.moved)} moved, "
+                                f"{len(result.missing)} missing, {result.restored} restored")
+        self.folder_poll_job = self.root.after(FOLDER_POLL_MS, self._poll_folders)
+
+    # ---------- Duplicate Finder ----------
+    def _find_duplicates(self):
+        if self.duplicate_finder is not None:
+            return
+        songs = self.store.library_songs()
+        if not songs:
+            messagebox.showinfo("No Songs", "The library is empty")
+            return
+        self.duplicate_finder = DuplicateFinder(self.import_executor, songs)
+        self.status_var.set(f"Looking for duplicates among {len(songs)} files...")
+        self.root.after(IMPORT_POLL_MS, self._poll_duplicates)
+
+    def _poll_duplicates(self):
+        finder = self.duplicate_finder
+        if not finder.poll():
+            stage = {'size': "Comparing sizes", 'edge': "Hashing file ends", 'full': "Hashing files"}[finder.stage_name]
+            self.status_var.set(f"{stage}... {finder.done}/{finder.total}")
+            self.root.after(IMPORT_POLL_MS, self._poll_duplicates)
+            return
+        self.duplicate_finder = None
+        self._save_metadata_cache()
+        groups = finder.result
+        if not groups:
+            self.status_var.set("No duplicate files found")
+            return
+        extra = sum(len(group) - 1 for group in groups)
+        shown = "\n".join("  " + "  =  ".join(os.path.basename(path) for _, path in group) for group in groups[:10])
+        more = f"\n  ...and {len(groups) - 10} more" if len(groups) > 10 else ""
+        self.status_var.set(f"Found {extra} duplicate file(s)")
+        if messagebox.askyesno("Duplicates Found",
+                               f"{extra} file(s) duplicate another file:\n{shown}{more}\n\n"
+                               "Merge them so every playlist uses the first copy?"):
+            self._merge_duplicates(groups)
+
+    def _merge_duplicates(self, groups):
+        """Point every playlist at the first copy of each group, dropping entries that now repeat"""
+        replacements = {}
+        for group in groups:
+            keep_id, keep_path = group[0]
+            try:
+                song = self.catalog.get(keep_id, keep_path)
+            except OSError:
+                continue
+            replacements.update((song_id, song) for song_id, _ in group[1:])
+        for playlist in self.playlists.values():
+            if playlist is not None:
+                playlist.merge_songs(replacements)  # mirrors the store below, which also deletes its repeats
+        removed = self.store.merge_songs([[group[0][0]] + [song_id for song_id, _ in group[1:]]
+                                          for group in groups if group[1][0] in replacements])
+        for entry_id in removed:
+            self.search_index.remove(entry_id)  # entries of playlists that aren't loaded
+        for name, _, song_count in self.store.summaries():
+            if name in self.playlist_info and name not in self.smart_rules:
+                self.playlist_info[name]['count'] = song_count
+        self.song_listbox.selection_clear()
+        self._update_song_list()
+        self._save_playlists()
+        self.status_var.set(f"Merged {len(replacements)} duplicate file(s); removed {len(removed)} repeated entries")
+
+    # ---------- Loudness Analysis ----------
+    def _analyze_loudness(self):
+        """Analyze every library file without a cached result (re-run later if one is already going)"""
+        if self.loudness is not None:
+            self.loudness_rerun = True
+            return
+        if not self.store:
+            return
+        self.loudness = LoudnessAnalyzer(self.import_executor, [path for _, path in self.store.library_songs()])
+        self.root.after(ANALYSIS_POLL_MS, self._poll_loudness)
+
+    def _poll_loudness(self):
+        analyzer = self.loudness
+        if analyzer is None:
+            return
+        if not analyzer.poll():
+            self.root.after(ANALYSIS_POLL_MS, self._poll_loudness)
+            return
+        self.loudness = None
+        if analyzer.analyzed:
+            self.radio_stale = True
+            self._save_metadata_cache()
+            self._apply_volume()  # the playing track may have just been measured
+            self._extend_radio()
+            self.status_var.set(f"Loudness analysis: {analyzer.analyzed} track(s) in {analyzer.elapsed:.1f} s "
+                                f"({analyzer.tracks_per_second:.1f} tracks/s)")
+        if self.loudness_rerun:
+            self.loudness_rerun = False
+            self._analyze_loudness()
+
+    # ---------- Song Radio ----------
+    def _toggle_radio(self):
+        if not self.radio_on and not numpy_available():
+            messagebox.showwarning("Radio Unavailable", "Song radio needs NumPy (pip install numpy)")
+            return
+        self.radio_on = not self.radio_on
+        self.radio_btn.config(text="Radio: ON" if self.radio_on else "Radio: OFF")
+        if self.radio_on:
+            self.status_var.set("Radio on: similar songs are queued as playback advances")
+            self._extend_radio()
+        else:
+            self.status_var.set("Radio off")
+
+    def _radio_index_ready(self):
+        """The similarity index, rebuilt in the background after new analysis (None until the first build)"""
+        if self.radio_stale and self.radio_build is None and self.store:
+            self.radio_stale = False
+            paths = [path for _, path in self.store.library_songs()]
+            self.radio_build = self.import_executor.submit(SimilarityIndex.from_cache, paths)
+            self.root.after(ANALYSIS_POLL_MS, self._poll_radio_index)
+        return self.radio_index
+
+    def _poll_radio_index(self):
+        if self.radio_build is None:
+            return
+        if not self.radio_build.done():
+            self.root.after(ANALYSIS_POLL_MS, self._poll_radio_index)
+            return
+        build, self.radio_build = self.radio_build, None
+        try:
+            self.radio_index = build.result()
+        except Exception as e:
+            self.status_var.set(f"Radio: could not build the similarity index ({e})")
+            return
+        self._extend_radio()
+
+    def _extend_radio(self):
+        """Keep RADIO_LOOKAHEAD songs after the playing one, appending the library's closest matches"""
+        if not self.radio_on or not self.current_playlist or self.current_playlist in self.smart_rules:
+            return
+        playlist = self._get_playlist(self.current_playlist)
+        if playlist.is_shuffled or playlist.current is None:
+            return  # radio extends the queue in order; a shuffled queue has no "end" to extend
+        if self.radio_job is not None and self.radio_job in self.import_jobs:
+            return  # the previous picks are still being added
+        queued = playlist.length - 1 - playlist.index_of(playlist.current.node_id)
+        if queued >= RADIO_LOOKAHEAD:
+            return
+        index = self._radio_index_ready()
+        if index is None:
+            return  # _poll_radio_index calls back once the index exists
+        seeds = []
+        node = playlist.tail
+        while node is not None and len(seeds) < RADIO_SEEDS:
+            seeds.append(node.song.filepath)
+            node = node.prev
+        in_playlist = {node.song.filepath for node in playlist.nodes.values()}
+        picks = index.nearest(seeds, RADIO_LOOKAHEAD - queued, exclude=in_playlist)
+        if not picks:
+            if not any(seed in index for seed in seeds):
+                self.status_var.set("Radio: waiting for these songs to be analyzed")
+            return
+        self.radio_job = self._start_import(picks, playlist.name, 'add', song_ids=self.store.song_ids(picks))
+        self.status_var.set(f"Radio: queued {len(picks)} similar song(s)")
+
+    # ---------- Smart Playlists ----------
+    def _create_smart_playlist(self):
+        name = simpledialog.askstring("New Smart Playlist", "Enter playlist name:")
+        if not name or not name.strip():
+            return
+        name = name.strip()
+        if name in self.playlists:
+            messagebox.showwarning("Duplicate Name", "Playlist with this name already exists")
+            return
+        text = simpledialog.askstring(
+            "Smart Playlist Rules",
+            "Songs matching (fields: title, artist, album, genre, duration, plays, added, played):\n"
+            "e.g.  artist is Queen and duration < 300\n"
+            "      added within 30 days and plays = 0")
+        if not text or not text.strip():
+            return
+        try:
+            rules = SmartRules.parse(text)
+        except ValueError as e:
+            messagebox.showerror("Invalid Rules", str(e))
+            return
+        self.smart_rules[name] = rules
+        self.playlists[name] = None
+        self.store.create_smart_playlist(name, rules.text)
+        self._save_playlists()
+        self.current_playlist = name
+        self._get_playlist(name)
+        self._update_playlist_dropdown()
+        self._update_song_list()
+        self.status_var.set(f"Created smart playlist: {name} | {rules.text}")
+
+    def _refuse_smart_edit(self):
+        """Warn and return True if the current playlist is a smart one, whose songs come from its rules"""
+        rules = self.smart_rules.get(self.current_playlist)
+        if rules is None:
+            return False
+        messagebox.showwarning("Smart Playlist", f"'{self.current_playlist}' is filled by its rules:\n{rules.text}")
+        return True
+
+    def _fill_smart_playlist(self, playlist):
+        """Load the library songs matching a smart playlist (after the library index is built)"""
+        if self.library is None:
+            self._build_library()  # _library_built comes back here
+            return
+        playlist.library = self.library
+        info = self.playlist_info.pop(playlist.name, None)
+        members = self.library.members(playlist.rules)
+        if members:
+            paths = self.library.paths
+            self._start_import([paths[song_id] for song_id in members], playlist.name, 'load',
+                               bool(info and info['is_shuffled']), song_ids=members)
+
+    def _build_library(self):
+        if self.library is not None or self.library_build is not None or not self.store:
+            return
+        self.library_build = self.import_executor.submit(LibraryIndex.build, self.store.library_attributes())
+        self.root.after(IMPORT_POLL_MS, self._library_built)
+
+    def _library_built(self):
+        if not self.library_build.done():
+            self.root.after(IMPORT_POLL_MS, self._library_built)
+            return
+        build, self.library_build = self.library_build, None
+        try:
+            self.library = build.result()
+        except Exception as e:
+            self.status_var.set(f"Could not index the library for smart playlists: {e}")
+            return
+        backlog, self.library_backlog = self.library_backlog, []
+        for change in backlog:
+            change(self.library)
+        for name in self.smart_rules:
+            playlist = self.playlists.get(name)
+            if playlist is not None and playlist.library is None:
+                self._fill_smart_playlist(playlist)
+        self.root.after(SMART_REFRESH_MS, self._refresh_smart_playlists)
+
+    def _update_library(self, change):
+        """Apply change(library) -> [changed song ids], then re-check the loaded smart playlists for those songs"""
+        if self.library is None:
+            if self.library_build is not None:
+                self.library_backlog.append(change)
+            # else: a later build reads the current state from the store and the metadata cache
+            return
+        changed = change(self.library)
+        if changed:
+            self._update_smart_playlists(changed)
+
+    def _update_smart_playlists(self, song_ids):
+        visible = False
+        for name in self.smart_rules:
+            playlist = self.playlists.get(name)
+            if playlist is None or playlist.library is None:
+                continue  # not loaded: it is computed from the library when opened
+            for song_id in song_ids:
+                if playlist.update(song_id, lambda song_id=song_id: self._library_song(song_id)):
+                    visible = visible or name == self.current_playlist
+        if visible:
+            self._update_song_list()
+
+    def _library_song(self, song_id):
+        try:
+            return self.catalog.get(song_id, self.library.paths[song_id])
+        except (OSError, KeyError):
+            return None
+
+    def _read_tags(self, rows):
+        """Re-read the tags of new or changed files in the background, then update the library"""
+        if self.library is None and self.library_build is None:
+            return
+        self.tag_reads.append(self.import_executor.submit(LibraryIndex.read_tags, rows))
+        if len(self.tag_reads) == 1:
+            self.root.after(IMPORT_POLL_MS, self._poll_tag_reads)
+
+    def _poll_tag_reads(self):
+        while self.tag_reads and self.tag_reads[0].done():
+            try:
+                rows = self.tag_reads.pop(0).result()
+            except Exception:
+                continue
+            self._update_library(lambda library: [song_id for song_id, path, attrs in rows
+                                                  if library.set(song_id, path, attrs)])
+        if self.tag_reads:
+            self.root.after(IMPORT_POLL_MS, self._poll_tag_reads)
+
+    def _count_play(self):
+        """Count a play for the song that was playing, now that playback has moved past it"""
+        song, self.played_song = self.played_song, None
+        if song is None or song.song_id is None or not self.store:
+            return
+        when = time.time()
+        self.store.record_play(song.song_id, when)
+        self._save_playlists()
+        self._update_library(lambda library: [song.song_id] if library.record_play(song.song_id, when) else [])
+
+    def _refresh_smart_playlists(self):
+        """Time alone changes "added within"/"played before" rules; re-check those playlists now and then"""
+        for name, rules in self.smart_rules.items():
+            playlist = self.playlists.get(name)
+            if playlist is None or playlist.library is None or not rules.uses_age:
+                continue
+            changed = set(self.library.members(rules)).symmetric_difference(playlist.member_ids)
+            for song_id in changed:
+                playlist.update(song_id, lambda song_id=song_id: self._library_song(song_id))
+            if changed and name == self.current_playlist:
                 self._update_song_list()
-                self._save_playlists()
-                self.status_var.set(f"Added {added} song(s) to {self.current_playlist}")
+        self.root.after(SMART_REFRESH_MS, self._refresh_smart_playlists)
+
+    def _update_import_progress(self):
+        if not self.import_jobs:
+            self.import_progress.pack_forget()
+            self.import_cancel_btn.pack_forget()
+            return
+        total = sum(job.total for job in self.import_jobs)
+        done = sum(job.delivered for job in self.import_jobs)
+        self.import_progress_var.set(done / total * 100 if total else 0)
+        if not self.import_progress.winfo_ismapped():
+            self.import_cancel_btn.pack(side=tk.RIGHT, padx=(6, 0))
+            self.import_progress.pack(side=tk.RIGHT, padx=(6, 0))
+        if any(job.kind == 'add' for job in self.import_jobs):
+            self.import_cancel_btn.config(state='normal')
+            self.status_var.set(f"Importing songs... {done}/{total}")
+        else:
+            self.import_cancel_btn.config(state='disabled')
+            self.status_var.set(f"Loading playlists... {done}/{total}")
+
+    def _cancel_imports(self):
+        # Saved playlists keep loading; only user imports can be cancelled
+        for job in self.import_jobs:
+            if job.kind == 'add':
+                job.cancel()
 
     def _remove_song(self):
+        """Remove every selected song in one batch (one relink, one redraw, one save)"""
         if not self.current_playlist:
             messagebox.showwarning("No Playlist", "No playlist selected")
             return
+        if self._refuse_smart_edit():
+            return
+        if self.search_results is not None:
+            messagebox.showwarning("Search Active", "Clear the search to edit the playlist")
+            return
         selected = self.song_listbox.curselection()
         if not selected:
             messagebox.showwarning("No Selection", "Please select a song to remove")
             return
         song_title = self.song_listbox.get(selected[0])
-        if self.playlists[self.current_playlist].remove_song(song_title):
-            if self.current_song and self.current_song.title == song_title:
-                self._stop_song()
-            self._update_song_list()
-            self._save_playlists()
-            self.status_var.set(f"Removed: {song_title}")
-        else:
+        nodes = [node for node in map(self._selected_node, selected) if node]
+        removed = self._get_playlist(self.current_playlist).remove_nodes([node.node_id for node in nodes])
+        if not removed:
             messagebox.showerror("Error", f"Could not remove {song_title}")
+            return
+        self._removed(removed)
+        self.status_var.set(f"Removed: {song_title}" if len(removed) == 1 else f"Removed {len(removed)} songs")
+
+    def _dedupe_playlist(self):
+        if not self.current_playlist:
+            messagebox.showwarning("No Playlist", "No playlist selected")
+            return
+        if self._refuse_smart_edit():
+            return
+        removed = self._get_playlist(self.current_playlist).dedupe()
+        if removed:
+            self._removed(removed)
+        self.status_var.set(f"Removed {len(removed)} duplicate(s) from {self.current_playlist}")
+
+    def _removed(self, nodes):
+        """Persist, redraw and save once after a batch of entries left the current playlist"""
+        self.store.remove_entries(node.node_id for node in nodes)
+        if any(node.song is self.current_song for node in nodes):
+            self._stop_song()
+        self.song_listbox.selection_clear()
+        self._update_song_list()
+        self._save_playlists()
 
     def _move_song(self, direction):
+        """Move the selected songs one row up or down as a block (they close ranks first)"""
         if not self.current_playlist:
             messagebox.showwarning("No Playlist", "No playlist selected")
             return
-        playlist = self.playlists[self.current_playlist]
+        if self._refuse_smart_edit():
+            return
+        playlist = self._get_playlist(self.current_playlist)
         if playlist.is_shuffled:
             messagebox.showwarning("Shuffle Active", "Cannot move songs while shuffle is active")
             return
+        if self.search_results is not None:
+            messagebox.showwarning("Search Active", "Clear the search to edit the playlist")
+            return
+        if self._sort_spec():
+            messagebox.showwarning("Sorted View", "Switch to queue order (or apply the sort) to move songs")
+            return
         selected = self.song_listbox.curselection()
         if not selected:
             messagebox.showwarning("No Selection", "Please select a song to move")
             return
         song_title = self.song_listbox.get(selected[0])
-        if playlist.move_song(song_title, direction):
-            self._update_song_list()
+        nodes = [node for node in map(self._selected_node, selected) if node]
+        new_pos = selected[0] - 1 if direction == 'up' else selected[0] + 1
+        new_pos = max(0, min(new_pos, playlist.length - len(nodes)))
+        moved = playlist.move_nodes([node.node_id for node in nodes], new_pos)
+        if moved:
+            self.store.move_entries(playlist.name, moved)
             self._save_playlists()
-            new_pos = selected[0] - 1 if direction == 'up' else selected[0] + 1
-            new_pos = max(0, min(new_pos, playlist.length - 1))
-            self.song_listbox.selection_clear(0, tk.END)
-            self.song_listbox.selection_set(new_pos)
+            self.song_listbox.selection_clear()
+            self._update_song_list()
+            self.song_listbox.selection_set(new_pos, new_pos + len(moved) - 1)
             self.song_listbox.see(new_pos)
-            self.status_var.set(f"Moved {song_title} {direction}")
+            what = song_title if len(moved) == 1 else f"{len(moved)} songs"
+            self.status_var.set(f"Moved {what} {direction}")
 
     def _toggle_order(self):
         if not self.current_playlist:
             messagebox.showwarning("No Playlist", "No playlist selected")
             return
-        playlist = self.playlists[self.current_playlist]
+        playlist = self._get_playlist(self.current_playlist)
         playlist.unshuffle()
-        playlist.is_shuffled = False
-        playlist.shuffle_session = None
+        self.store.set_shuffled(playlist.name, False)
+        self._save_playlists()
         self.order_btn.config(text="Order: ON")
         self.shuffle_btn.config(text="Shuffle: OFF")
         self._update_song_list()
@@ -518,10 +1448,10 @@ class MusicPlayerApp:
         if not self.current_playlist:
             messagebox.showwarning("No Playlist", "No playlist selected")
             return
-        playlist = self.playlists[self.current_playlist]
+        playlist = self._get_playlist(self.current_playlist)
         playlist.shuffle()
-        playlist.is_shuffled = True
-        playlist.shuffle_session = []
+        self.store.set_shuffled(playlist.name, True)
+        self._save_playlists()
         self.shuffle_btn.config(text="Shuffle: ON")
         self.order_btn.config(text="Order: OFF")
         self._update_song_list()
@@ -531,7 +1461,7 @@ class MusicPlayerApp:
     def _update_move_buttons_state(self):
         if not self.current_playlist or not self.move_up_btn or not self.move_down_btn:
             return
-        playlist = self.playlists[self.current_playlist]
+        playlist = self._get_playlist(self.current_playlist)
         state = 'disabled' if playlist.is_shuffled else 'normal'
         self.move_up_btn.config(state=state)
         self.move_down_btn.config(state=state)
@@ -539,98 +1469,396 @@ class MusicPlayerApp:
     def _update_shuffle_button_state(self):
         if not self.current_playlist or not self.shuffle_btn:
             return
-        playlist = self.playlists[self.current_playlist]
+        playlist = self._get_playlist(self.current_playlist)
         self.shuffle_btn.config(text=("Shuffle: ON" if playlist.is_shuffled else "Shuffle: OFF"))
 
+    def _selected_node(self, row):
+        """Map a listbox row back to its playlist node (O(log n) through the order tree)"""
+        if not self.current_playlist or self.search_results is not None:
+            return None
+        playlist = self._get_playlist(self.current_playlist)
+        if not 0 <= row < playlist.length:
+            return None
+        view = self._sorted_view(playlist)
+        return view[row] if view is not None else playlist.node_at(row)
+
+    def _fetch_song_rows(self, first, count):
+        """Row source for the virtual list: titles of `count` songs starting at queue position `first`"""
+        if self.search_results is not None:
+            index = self.search_index
+            return [f"{index.title_of(node_id)}  —  {index.playlist_of(node_id)}"
+                    for node_id in self.search_results[first:first + count]]
+        playlist = self.playlists.get(self.current_playlist) if self.current_playlist else None
+        if playlist is None or first >= playlist.length:
+            return []
+        view = self._sorted_view(playlist)
+        if view is not None:
+            return [node.song.title for node in view[first:first + count]]
+        rows = []
+        node = playlist.node_at(first)
+        while node and len(rows) < count:
+            rows.append(node.song.title)
+            node = node.next
+        return rows
+
     def _update_song_list(self):
-        self.song_listbox.delete(0, tk.END)
+        query = self.search_var.get().strip()
+        if query:
+            self._run_search(query)
+            return
+        if self.search_results is not None:
+            self.search_results = None
+            self.song_listbox.selection_clear(0, tk.END)
+        playlist = self._get_playlist(self.current_playlist) if self.current_playlist else None
+        self.song_listbox.set_count(playlist.length if playlist else 0)
+        self._highlight_current()
+
+    # ---------- Sorting ----------
+    def _sort_spec(self):
+        spec = SORT_PRESETS.get(self.sort_var.get(), ())
+        if self.sort_reversed:
+            spec = tuple((field, not descending) for field, descending in spec)
+        return spec
+
+    def _sorted_view(self, playlist):
+        """The list of nodes shown for playlist under the chosen sort, or None for queue order"""
+        spec = self._sort_spec()
+        return playlist.sorted_nodes(spec) if spec else None
+
+    def _toggle_sort_direction(self):
+        self.sort_reversed = not self.sort_reversed
+        self.reverse_btn.config(text="↓" if self.sort_reversed else "↑")
+        self._update_song_list()
+
+    def _apply_sort(self):
+        """Make the sorted view the playlist's queue order (one relink, one store renumbering)"""
         if not self.current_playlist:
+            messagebox.showwarning("No Playlist", "No playlist selected")
             return
-        playlist = self.playlists[self.current_playlist]
-        for title in playlist.get_song_list():
-            self.song_listbox.insert(tk.END, title)
-        if playlist.current and self.current_song:
-            try:
-                songs = playlist.get_song_list()
-                if self.current_song.title in songs:
-                    idx = songs.index(self.current_song.title)
-                    self.song_listbox.selection_clear(0, tk.END)
-                    self.song_listbox.selection_set(idx)
-                    self.song_listbox.see(idx)
-            except (ValueError, AttributeError):
-                pass
+        if self._refuse_smart_edit():
+            return
+        playlist = self._get_playlist(self.current_playlist)
+        view = self._sorted_view(playlist)
+        if view is None:
+            return
+        if playlist.is_shuffled:
+            messagebox.showwarning("Shuffle Active", "Cannot reorder songs while shuffle is active")
+            return
+        playlist.apply_order(view)
+        self.store.reorder_entries(playlist.name, view)
+        self._save_playlists()
+        order = self.sort_var.get()
+        self.sort_var.set(QUEUE_ORDER)
+        self._update_song_list()
+        direction = " (reversed)" if self.sort_reversed else ""
+        self.status_var.set(f"{playlist.name} reordered by {order.lower()}{direction}")
+
+    # ---------- Search ----------
+    def _index_stored_entries(self):
+        if not self.search_store_indexed and self.store:
+            # Playlists that were never opened are indexed from their stored paths, once
+            self.search_index.add_paths(self.store.all_entries())
+            self.search_store_indexed = True
+
+    def _run_search(self, query):
+        self._index_stored_entries()
+        self.search_results = self.search_index.search(query)
+        self.song_listbox.selection_clear(0, tk.END)
+        self.song_listbox.set_count(len(self.search_results))
+        self.song_listbox.see(0)
+        self.status_var.set(f"{len(self.search_results)} match(es) for '{query}'")
+
+    def _play_search_hit(self, node_id):
+        """Switch to the hit's playlist and play it (deferred until the playlist has loaded)"""
+        name = self.search_index.playlist_of(node_id)
+        if name not in self.playlists:
+            return
+        if name != self.current_playlist:
+            self.current_playlist = name
+            self.playlist_var.set(name)
+            self._update_shuffle_button_state()
+        node = self._get_playlist(name).set_current(node_id)
+        self.pending_play = None if node else node_id
+        if node:
+            self._play_audio(node.song)
+        else:
+            self.status_var.set(f"Loading {name}...")
+
+    def _highlight_current(self):
+        """Select and scroll to the playing song's row without touching the other rows"""
+        playlist = self.playlists.get(self.current_playlist) if self.current_playlist else None
+        if not playlist or not playlist.current or playlist.current.song is not self.current_song:
+            return
+        if self.search_results is not None:
+            return
+        view = self._sorted_view(playlist)
+        row = view.index(playlist.current) if view is not None else playlist.index_of(playlist.current.node_id)
+        self.song_listbox.selection_clear(0, tk.END)
+        self.song_listbox.selection_set(row)
+        self.song_listbox.see(row)
 
     # ---------- Playback ----------
     def _play_pause(self):
         if self.is_paused:
-            mixer.music.unpause()
+            if self._crossfading():
+                self.crossfader.resume()
+            else:
+                mixer.music.unpause()
             self.is_paused = False
             self.start_time += time.time() - self.pause_time
+            self._schedule_progress()
+            self._feed_crossfade()
             self.play_pause_btn.config(text="⏸")
             self.status_var.set(f"Resumed: {self.current_song.title if self.current_song else 'Unknown'}")
+            self._publish_state('resumed')
         elif self.is_playing:
             self._pause_song()
         else:
             self._play_song()
 
     def _play_song(self):
-        if not self.current_playlist or not self.playlists[self.current_playlist].length:
+        if self.search_results is not None:
+            if self.search_results:
+                selected = self.song_listbox.curselection()
+                self._play_search_hit(self.search_results[selected[0] if selected else 0])
+            return
+        if not self.current_playlist or not self._get_playlist(self.current_playlist).length:
             messagebox.showwarning("No Songs", "No songs in current playlist")
             return
-        playlist = self.playlists[self.current_playlist]
+        playlist = self._get_playlist(self.current_playlist)
         selected = self.song_listbox.curselection()
         if selected:
-            song_title = self.song_listbox.get(selected[0])
-            current = playlist.head
-            while current:
-                if current.song.title == song_title:
-                    playlist.current = current
-                    break
-                current = current.next
+            node = self._selected_node(selected[0])
+            if node:
+                playlist.set_current(node.node_id)
         if not playlist.current:
             playlist.current = playlist.head
         if playlist.current:
             self._play_audio(playlist.current.song)
 
     def _play_audio(self, song):
+        if not os.path.exists(song.filepath):
+            self._report_error("File Not Found", f"Audio file not found:\n{song.filepath}")
+            return
         try:
-            if not os.path.exists(song.filepath):
-                messagebox.showerror("File Not Found", f"Audio file not found:\n{song.filepath}")
+            self._ensure_audio()
+            if self._crossfade_seconds() > 0 and init_numpy():
+                mixer.music.stop()
+                self.playback_events.discard()
+                self.decoding = (song, self.prefetcher.run(DecodedTrack, song, self._track_gain(song)))
+                self.decoding_remote = self.remote_command
+                self._start_decoded()
                 return
+            if self.crossfader is not None:
+                self.crossfader.stop()
+            self.decoding = None
             mixer.music.load(song.filepath)
             mixer.music.play()
-            self.current_song = song
-            self.song_length = song.duration if song.duration and song.duration > 0 else 180
-            self.is_playing = True
-            self.is_paused = False
-            self.start_time = time.time()
-            self.time_total.config(text=self._format_time(self.song_length))
-            self.progress_var.set(0)
-            self.play_pause_btn.config(text="⏸")
-            self._update_now_playing(song)
-            self._update_song_list()
-            self.status_var.set(f"Now playing: {song.title}")
+            self.playback_events.discard()
+            self._song_started(song)
         except pygame.error as e:
-            messagebox.showerror("Playback Error", f"Could not play file:\n{str(e)}")
+            self._report_error("Playback Error", f"Could not play file:\n{str(e)}")
         except Exception as e:
-            messagebox.showerror("Unexpected Error", f"An error occurred:\n{str(e)}")
+            self._report_error("Unexpected Error", f"An error occurred:\n{str(e)}")
+
+    def _report_error(self, title, message):
+        """Show a playback error, or fail the remote command that caused it (a modal dialog would stall the bridge)"""
+        if self.remote_command:
+            raise RemoteError(500, f"{title}: {message}".replace("\n", " "))
+        messagebox.showerror(title, message)
+
+    def _start_decoded(self):
+        """Hand the song in `decoding` to the crossfade player once it has been decoded"""
+        if self.decoding is None:
+            return  # superseded by another play or a stop
+        song, future = self.decoding
+        if not future.done():
+            self.root.after(PREFETCH_POLL_MS, self._start_decoded)
+            return
+        self.decoding = None
+        try:
+            track = future.result()
+        except (OSError, ValueError, pygame.error) as e:
+            if self.decoding_remote and self.remote is not None:
+                # No dialog for a remote play: it would stall the remote commands behind it
+                self.status_var.set(f"Could not play {song.title}: {e}")
+                self.remote.publish({'type': 'error', 'message': f"Could not play {song.filepath}: {e}"})
+            else:
+                self._report_error("Playback Error", f"Could not play file:\n{str(e)}")
+            return
+        if self.crossfader is None:
+            self.crossfader = CrossfadePlayer(self._crossfade_seconds(), self._crossfade_advanced, self._next_song)
+        self.crossfader.set_volume(float(self.volume_var.get()))
+        self.decoded = None
+        self.crossfader.play(track)
+        self._song_started(song)
+        self._feed_crossfade()
+
+    def _crossfade_seconds(self):
+        try:
+            return min(MAX_CROSSFADE_S, max(0.0, float(self.crossfade_var.get())))
+        except (ValueError, tk.TclError):
+            return 0.0
+
+    def _set_crossfade(self):
+        if self.crossfader is not None:
+            self.crossfader.set_fade(self._crossfade_seconds())
+
+    def _crossfading(self):
+        return self.crossfader is not None and self.crossfader.active
+
+    def _feed_crossfade(self):
+        """Keep the crossfade player's channel queue topped up while it is playing"""
+        if self.crossfade_job is not None:
+            self.root.after_cancel(self.crossfade_job)
+            self.crossfade_job = None
+        if not self._crossfading() or self.crossfader.paused:
+            return
+        try:
+            self.crossfader.fill()
+        except pygame.error as e:
+            self._stop_song()
+            self._report_error("Playback Error", f"Crossfade playback failed:\n{str(e)}")
+            return
+        if self._crossfading():
+            self.crossfade_job = self.root.after(CROSSFADE_FEED_MS, self._feed_crossfade)
+
+    def _crossfade_advanced(self, track):
+        """The crossfade player started mixing in the upcoming track; move the playlist along with it"""
+        self.decoded = None  # consumed; a repeat of the same song needs a fresh decode
+        if self._upcoming_song() is track.song:
+            self._get_playlist(self.current_playlist).play_next()
+            self._song_started(track.song)
+        else:
+            self._next_song()
+
+    def _track_gain(self, song):
+        return track_gain(song.filepath) if self.normalize_var.get() else 1.0
+
+    def _ensure_audio(self):
+        """Start the mixer on first playback (raises pygame.error if no audio device)"""
+        if self.playback_events is None:
+            init_audio()
+            mixer.music.set_volume(self.volume_var.get())
+            self.playback_events = PlaybackEvents()
+
+    def _song_started(self, song):
+        """Update playback state and UI once the mixer is playing `song`"""
+        self._count_play()
+        self.played_song = song
+        self.current_song = song
+        self.song_length = song.duration if song.duration and song.duration > 0 else 180
+        self.is_playing = True
+        self.is_paused = False
+        self.start_time = time.time()
+        self.queued_song = None
+        self.time_total.config(text=self._format_time(self.song_length))
+        self.progress_var.set(0)
+        self.shown_second = None
+        self._cancel_progress()
+        self._schedule_progress()
+        self.play_pause_btn.config(text="⏸")
+        self._apply_volume()
+        self._update_now_playing(song)
+        self._highlight_current()
+        self.status_var.set(f"Now playing: {song.title}")
+        self._queue_upcoming()
+        self._extend_radio()
+        self._publish_state('now_playing')
+
+    def _upcoming_song(self):
+        if not self.current_playlist:
+            return None
+        node = self._get_playlist(self.current_playlist).peek_next()
+        return node.song if node else None
+
+    def _queue_upcoming(self):
+        """Prefetch the next track, then queue it in the mixer so the transition is gapless.
+
+        Called on every progress tick, so edits to the playlist that change the
+        upcoming song simply re-prefetch and replace the queued track.
+        """
+        if self.is_playing and self._crossfading():
+            self._decode_upcoming()
+            return
+        if not self.is_playing or not self.playback_events.use_events:
+            return  # the get_busy() fallback can't tell a queued transition from a stop
+        upcoming = self._upcoming_song()
+        if upcoming is None or upcoming is self.queued_song:
+            return
+        if self.prefetch is None or self.prefetch[0] is not upcoming:
+            self.prefetch = (upcoming, self.prefetcher.prefetch(upcoming.filepath))
+        if not self.prefetch[1].done():
+            # Check back soon rather than waiting a whole progress tick (matters for short tracks)
+            self.root.after(PREFETCH_POLL_MS, self._queue_upcoming)
+            return
+        try:
+            self.prefetch[1].result()
+            mixer.music.queue(upcoming.filepath)
+            self.queued_song = upcoming
+        except (OSError, pygame.error):
+            self.queued_song = None
+
+    def _decode_upcoming(self):
+        """Crossfade counterpart of queueing: decode the next track and give it to the player"""
+        player = self.crossfader
+        upcoming = self._upcoming_song()
+        if upcoming is None:
+            player.set_upcoming(None)
+            return
+        if player.upcoming is not None and player.upcoming.song is upcoming:
+            return
+        if self.decoded is None or self.decoded[0] is not upcoming:
+            self.decoded = (upcoming, self.prefetcher.run(DecodedTrack, upcoming, self._track_gain(upcoming)))
+        if not self.decoded[1].done():
+            self.root.after(PREFETCH_POLL_MS, self._queue_upcoming)
+            return
+        try:
+            player.set_upcoming(self.decoded[1].result())
+        except (OSError, ValueError, pygame.error):
+            player.set_upcoming(None)  # the player ends on the current track; _next_song reports the error
+
+    def _track_ended(self):
+        """The mixer finished a track; if it already started our queued one, just catch up"""
+        queued, self.queued_song = self.queued_song, None
+        if queued is not None and self._upcoming_song() is queued:
+            self._get_playlist(self.current_playlist).play_next()
+            self._song_started(queued)
+        else:
+            self._next_song()
 
     def _update_now_playing(self, song):
         self.now_playing_label.config(text=f"Now Playing: {song.title}")
         duration_str = self._format_time(song.duration)
-        info_text = f"Artist: {song.artist} | Album: {song.album} | Duration: {duration_str}"
+        album = f"{song.album} (#{song.track})" if song.track else song.album
+        info_text = f"Artist: {song.artist} | Album: {album} | Duration: {duration_str}"
+        if song.genre:
+            info_text += f" | Genre: {song.genre}"
         self.song_info_label.config(text=info_text)
 
     def _pause_song(self):
         if self.is_playing and not self.is_paused:
-            mixer.music.pause()
+            if self._crossfading():
+                self.crossfader.pause()
+            else:
+                mixer.music.pause()
             self.is_paused = True
             self.pause_time = time.time()
+            self._cancel_progress()
             self.play_pause_btn.config(text="⏯")
             self.status_var.set(f"Paused: {self.current_song.title if self.current_song else 'Unknown'}")
+            self._publish_state('paused')
 
     def _stop_song(self):
-        mixer.music.stop()
+        self._count_play()
+        if self.playback_events:
+            mixer.music.stop()
+            self.playback_events.discard()
+        if self.crossfader is not None:
+            self.crossfader.stop()
+        self.decoding = self.decoded = None
+        self._cancel_progress()
+        self.queued_song = None
         self.is_playing = False
         self.is_paused = False
         self.current_song = None
@@ -641,11 +1869,12 @@ class MusicPlayerApp:
         self.status_var.set("Playback stopped")
         self.now_playing_label.config(text="Now Playing:")
         self.song_info_label.config(text="No song selected")
+        self._publish_state('stopped')
 
     def _next_song(self):
         if not self.current_playlist:
             return
-        playlist = self.playlists[self.current_playlist]
+        playlist = self._get_playlist(self.current_playlist)
         if not playlist.length:
             return
         next_song = playlist.play_next()
@@ -657,7 +1886,7 @@ class MusicPlayerApp:
     def _previous_song(self):
         if not self.current_playlist:
             return
-        playlist = self.playlists[self.current_playlist]
+        playlist = self._get_playlist(self.current_playlist)
         if not playlist.length:
             return
         prev_song = playlist.play_previous()
@@ -666,34 +1895,99 @@ class MusicPlayerApp:
         else:
             self._stop_song()
 
+    def _seek(self, seconds):
+        """Jump to `seconds` into the playing song (also while paused)"""
+        if not self.is_playing or self.current_song is None:
+            return
+        seconds = max(0.0, min(seconds, self.song_length))
+        self.pause_time = time.time()
+        self.start_time = self.pause_time - seconds
+        if self._crossfading():
+            # Set the clock first: mixing resumes at once and may already reach the next fade,
+            # whose _song_started restarts it for the next song
+            self.crossfader.seek(seconds)
+        else:
+            # stop() also drops the queued track; _queue_upcoming queues it again below
+            mixer.music.stop()
+            self.playback_events.discard()
+            try:
+                mixer.music.play(start=seconds)
+            except pygame.error:
+                mixer.music.play()  # a format that can't seek: carry on from the start rather than stop
+                self.start_time = self.pause_time
+            if self.is_paused:
+                mixer.music.pause()
+            self.queued_song = None
+        self.shown_second = None
+        self._show_progress(min(time.time() - self.start_time, self.song_length))
+        self._cancel_progress()
+        self._schedule_progress()
+        self._queue_upcoming()
+        self._publish_state('seeked')
+
     def _set_volume(self, val):
+        self._apply_volume()
+        self._publish_state('volume')
+
+    def _apply_volume(self):
+        """Mixer volume = slider x the playing track's normalization gain (if enabled and analyzed)"""
+        if self.playback_events is None:
+            return  # volume_var is applied when the mixer starts
+        if self._crossfading():
+            # Normalization is baked into the mix per track, so the fade blends the two gains
+            player = self.crossfader
+            player.set_volume(float(self.volume_var.get()))
+            for track in (player.outgoing, player.current, player.upcoming):
+                if track is not None:
+                    track.gain = self._track_gain(track.song)
+            return
+        gain = 1.0
+        if self.normalize_var.get() and self.current_song is not None:
+            gain = track_gain(self.current_song.filepath)
         try:
-            volume = float(val)
-            mixer.music.set_volume(volume)
+            mixer.music.set_volume(float(self.volume_var.get()) * gain)
         except (ValueError, pygame.error):
             pass
 
+    def _schedule_progress(self):
+        """Wake up just after the displayed second changes (never while stopped or paused)"""
+        if self.progress_job is not None or not self.is_playing or self.is_paused:
+            return
+        elapsed = time.time() - self.start_time
+        delay = int(1000 - (elapsed * 1000) % 1000) + 10
+        if self.song_length > elapsed:
+            # Also wake right after the expected end, so queued tracks take over the UI promptly
+            delay = min(delay, int((self.song_length - elapsed) * 1000) + 30)
+        self.progress_job = self.root.after(delay, self._update_progress)
+
+    def _cancel_progress(self):
+        if self.progress_job is not None:
+            self.root.after_cancel(self.progress_job)
+            self.progress_job = None
+
     def _update_progress(self):
+        self.progress_job = None
+        if not (self.is_playing and not self.is_paused and self.current_song):
+            return
         try:
-            if self.is_playing and not self.is_paused and self.current_song:
-                if not mixer.music.get_busy():
-                    self._next_song()
-                    self.root.after(200, self._update_progress)
-                    return
-                elapsed = time.time() - self.start_time
-                if elapsed >= self.song_length:
-                    self.progress_var.set(100)
-                    self.time_elapsed.config(text=self._format_time(self.song_length))
-                    self._next_song()
-                    self.root.after(200, self._update_progress)
-                    return
-                progress_percent = (elapsed / self.song_length) * 100 if self.song_length > 0 else 0
-                progress_percent = min(100, max(0, progress_percent))
-                self.progress_var.set(progress_percent)
-                self.time_elapsed.config(text=self._format_time(elapsed))
+            if not self._crossfading() and self.playback_events.track_ended():
+                self._track_ended()
+            else:
+                self._show_progress(min(time.time() - self.start_time, self.song_length))
+                self._queue_upcoming()
         except Exception:
             pass
-        self.root.after(200, self._update_progress)
+        self._schedule_progress()
+
+    def _show_progress(self, elapsed):
+        """Touch the widgets only when the displayed second changes"""
+        second = int(elapsed)
+        if second == self.shown_second:
+            return
+        self.shown_second = second
+        self.time_elapsed.config(text=self._format_time(elapsed))
+        progress_percent = (elapsed / self.song_length) * 100 if self.song_length > 0 else 0
+        self.progress_var.set(min(100, max(0, progress_percent)))
 
     def _format_time(self, seconds):
         try:
@@ -704,57 +1998,356 @@ class MusicPlayerApp:
         except (ValueError, TypeError):
             return "0:00"
 
+    # ---------- Remote Control ----------
+    def _start_remote(self):
+        """Start the remote-control server if one was asked for on the command line"""
+        port, unix_path = self.remote_address
+        if port is None and unix_path is None:
+            return
+        self.remote_bridge = TkBridge({
+            'playlists': self._remote_playlists, 'songs': self._remote_songs, 'search': self._remote_search,
+            'queue': self._remote_queue, 'play': self._remote_play, 'pause': self._remote_pause,
+            'resume': self._remote_resume, 'toggle': self._remote_toggle, 'next': self._remote_next,
+            'previous': self._remote_previous, 'stop': self._remote_stop, 'seek': self._remote_seek,
+            'volume': self._remote_volume, 'add': self._remote_add, 'move': self._remote_move,
+            'remove': self._remote_remove,
+        })
+        try:
+            self.remote = RemoteServer(self.remote_bridge, port=REMOTE_PORT if port is None else port,
+                                       unix_path=unix_path).start()
+        except OSError as e:
+            self.remote_bridge = None
+            messagebox.showerror("Remote Control", f"Could not start the remote-control server:\n{str(e)}")
+            return
+        self._publish_state('status')
+        self.root.after(REMOTE_POLL_MS, self._poll_remote)
+
+    def _poll_remote(self):
+        """Run the commands remote clients queued since the last tick"""
+        if self.remote is None:
+            return
+        self.remote_command = True
+        try:
+            self.remote_bridge.drain()
+        finally:
+            self.remote_command = False
+        self.root.after(REMOTE_POLL_MS, self._poll_remote)
+
+    def _publish_state(self, event):
+        """Tell /events clients what changed; the snapshot also answers /status until the next event"""
+        if self.remote is not None:
+            status = self._remote_status()
+            self.remote.publish(dict(status, type=event), status)
+
+    def _remote_status(self):
+        if self.is_playing and self.current_song is not None:
+            state = 'paused' if self.is_paused else 'playing'
+            position = (self.pause_time if self.is_paused else time.time()) - self.start_time
+        else:
+            state, position = 'stopped', 0.0
+        playlist = self.playlists.get(self.current_playlist) if self.current_playlist else None
+        node = playlist.current if playlist is not None else None
+        song = None
+        if state != 'stopped':
+            song = self._remote_song(self.current_song, node.node_id if node and node.song is self.current_song
+                                     else None)
+        return {'state': state, 'song': song, 'playlist': self.current_playlist,
+                'position': round(min(position, self.song_length), 3),
+                'duration': self.song_length if song else 0, 'volume': round(float(self.volume_var.get()), 3)}
+
+    def _remote_song(self, song, node_id=None):
+        return {'node_id': node_id, 'title': song.title, 'artist': song.artist, 'album': song.album,
+                'duration': song.duration, 'path': song.filepath}
+
+    def _remote_int(self, params, key, default=None, low=None, high=None):
+        value = params.get(key, default)
+        if value is None:
+            raise RemoteError(400, f"Missing '{key}'")
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise RemoteError(400, f"'{key}' must be an integer") from None
+        if low is not None:
+            value = max(low, value)
+        return value if high is None else min(high, value)
+
+    def _remote_node_ids(self, params):
+        node_ids = params.get('node_ids')
+        if not isinstance(node_ids, list) or not node_ids or not all(type(node_id) is int for node_id in node_ids):
+            raise RemoteError(400, "'node_ids' must be a non-empty list of integers")
+        return node_ids
+
+    def _remote_playlist(self, params):
+        """The playlist named in the request (default: the current one), loaded if needed"""
+        name = params.get('playlist') or self.current_playlist
+        if name not in self.playlists:
+            raise RemoteError(404, f"No playlist named '{name}'" if name else "No playlist selected")
+        return self._get_playlist(name)
+
+    def _remote_editable(self, params):
+        """The playlist a remote edit targets, refusing smart playlists and ones still loading"""
+        playlist = self._remote_playlist(params)
+        rules = self.smart_rules.get(playlist.name)
+        if rules is not None:
+            raise RemoteError(409, f"'{playlist.name}' is filled by its rules: {rules.text}")
+        if self._loading(playlist.name):
+            raise RemoteError(409, f"'{playlist.name}' is still loading")
+        return playlist
+
+    def _loading(self, name):
+        if name in self.smart_rules:
+            return self.library is None
+        return any(job.playlist_name == name and job.kind == 'load' for job in self.import_jobs)
+
+    def _remote_switch(self, name):
+        if name != self.current_playlist:
+            self.playlist_var.set(name)
+            self._select_playlist()
+
+    def _remote_playlists(self, params):
+        rows = []
+        for name, playlist in self.playlists.items():
+            rules = self.smart_rules.get(name)
+            if name in self.playlist_info and rules is None:
+                count = self.playlist_info[name]['count']
+            else:
+                count = playlist.length if playlist is not None else None  # unknown until a smart one is matched
+            rows.append({'name': name, 'count': count, 'rules': rules.text if rules else None,
+                         'current': name == self.current_playlist})
+        return {'playlists': rows}
+
+    def _remote_songs(self, params):
+        playlist = self._remote_playlist(params)
+        offset = self._remote_int(params, 'offset', 0, low=0)
+        limit = self._remote_int(params, 'limit', REMOTE_PAGE_SIZE, low=0, high=REMOTE_MAX_PAGE)
+        songs = []
+        node = playlist.node_at(offset) if offset < playlist.length else None
+        while node is not None and len(songs) < limit:
+            songs.append(self._remote_song(node.song, node.node_id))
+            node = node.next
+        return {'playlist': playlist.name, 'total': playlist.length, 'offset': offset,
+                'loading': self._loading(playlist.name), 'shuffled': playlist.is_shuffled, 'songs': songs}
+
+    def _remote_search(self, params):
+        query = params.get('q', '')
+        self._index_stored_entries()
+        limit = self._remote_int(params, 'limit', REMOTE_PAGE_SIZE, low=1, high=REMOTE_MAX_PAGE)
+        index = self.search_index
+        return {'query': query, 'hits': [{'node_id': node_id, 'playlist': index.playlist_of(node_id),
+                                          'title': index.title_of(node_id)} for node_id in index.search(query, limit)]}
+
+    def _remote_queue(self, params):
+        """The playing entry and the ones after it (only the next one is decided ahead while shuffled)"""
+        limit = self._remote_int(params, 'limit', REMOTE_PAGE_SIZE, low=0, high=REMOTE_MAX_PAGE)
+        playlist = self.playlists.get(self.current_playlist) if self.current_playlist else None
+        current = playlist.current if playlist is not None else None
+        upcoming = []
+        if current is not None and playlist.is_shuffled:
+            upcoming = [node for node in (playlist.peek_next(),) if node is not None][:limit]
+        elif current is not None:
+            node = current.next or playlist.head
+            while node is not current and len(upcoming) < limit:
+                upcoming.append(node)
+                node = node.next or playlist.head
+        return {'playlist': self.current_playlist, 'shuffled': bool(playlist and playlist.is_shuffled),
+                'current': self._remote_song(current.song, current.node_id) if current else None,
+                'upcoming': [self._remote_song(node.song, node.node_id) for node in upcoming]}
+
+    def _remote_play(self, params):
+        """Play an entry by node id or queue position; with neither, resume or start the current playlist"""
+        if 'node_id' in params:
+            node_id = self._remote_int(params, 'node_id')
+            self._index_stored_entries()
+            name = params.get('playlist') or self.search_index.playlist_of(node_id)
+            if name is not None and name == self.search_index.playlist_of(node_id) and name in self.playlists:
+                self._remote_switch(name)
+                self._play_search_hit(node_id)  # waits for the playlist to load if it has to
+                return self._remote_status()
+            playlist = self._remote_playlist({'playlist': name})
+            node = playlist.get_node(node_id)
+        elif 'index' in params:
+            playlist = self._remote_playlist(params)
+            index = self._remote_int(params, 'index')
+            node = playlist.node_at(index) if 0 <= index < playlist.length else None
+        elif self.is_paused:
+            return self._remote_resume(params)
+        elif self.is_playing:
+            return self._remote_status()
+        else:
+            playlist = self._remote_playlist(params)
+            node = playlist.current or playlist.head
+        if node is None and self._loading(playlist.name):
+            raise RemoteError(409, f"'{playlist.name}' is still loading")
+        if node is None:
+            raise RemoteError(404, "No such song in the playlist")
+        if not os.path.exists(node.song.filepath):
+            raise RemoteError(404, f"Audio file not found: {node.song.filepath}")
+        self._remote_switch(playlist.name)
+        playlist.set_current(node.node_id)
+        self._play_audio(node.song)
+        return self._remote_status()
+
+    def _remote_pause(self, params):
+        self._pause_song()
+        return self._remote_status()
+
+    def _remote_resume(self, params):
+        if self.is_paused:
+            self._play_pause()
+        return self._remote_status()
+
+    def _remote_toggle(self, params):
+        if not self.is_playing:
+            return self._remote_play({})
+        self._play_pause()
+        return self._remote_status()
+
+    def _remote_next(self, params):
+        if not self.current_playlist:
+            raise RemoteError(409, "No playlist selected")
+        self._next_song()
+        return self._remote_status()
+
+    def _remote_previous(self, params):
+        if not self.current_playlist:
+            raise RemoteError(409, "No playlist selected")
+        self._previous_song()
+        return self._remote_status()
+
+    def _remote_stop(self, params):
+        self._stop_song()
+        return self._remote_status()
+
+    def _remote_seek(self, params):
+        try:
+            seconds = float(params['seconds'])
+        except (KeyError, TypeError, ValueError):
+            raise RemoteError(400, "'seconds' must be a number") from None
+        if not self.is_playing:
+            raise RemoteError(409, "Nothing is playing")
+        self._seek(seconds)
+        return self._remote_status()
+
+    def _remote_volume(self, params):
+        try:
+            volume = float(params['volume'])
+        except (KeyError, TypeError, ValueError):
+            raise RemoteError(400, "'volume' must be a number from 0 to 1") from None
+        self.volume_var.set(max(0.0, min(volume, 1.0)))
+        self._set_volume(None)
+        return self._remote_status()
+
+    def _remote_add(self, params):
+        """Import files into a playlist (at `index`, else the end) in the background, like Add Songs"""
+        playlist = self._remote_editable(params)
+        paths = params.get('paths')
+        if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+            raise RemoteError(400, "'paths' must be a list of file paths")
+        insert_at = None if params.get('index') is None else self._remote_int(params, 'index', low=0)
+        found = [path for path in paths if os.path.isfile(path)]
+        if found:
+            self._start_import(found, playlist.name, 'add', song_ids=self.store.song_ids(found), insert_at=insert_at)
+            self.status_var.set(f"Importing {len(found)} song(s) into {playlist.name}...")
+        return {'playlist': playlist.name, 'importing': len(found),
+                'missing': [path for path in paths if path not in found]}
+
+    def _remote_move(self, params):
+        playlist = self._remote_editable(params)
+        if playlist.is_shuffled:
+            raise RemoteError(409, "Cannot move songs while shuffle is active")
+        moved = playlist.move_nodes(self._remote_node_ids(params), self._remote_int(params, 'index', low=0))
+        if moved:
+            self.store.move_entries(playlist.name, moved)
+            self._save_playlists()
+            if playlist.name == self.current_playlist:
+                self._update_song_list()
+        return {'playlist': playlist.name, 'moved': len(moved)}
+
+    def _remote_remove(self, params):
+        playlist = self._remote_editable(params)
+        removed = playlist.remove_nodes(self._remote_node_ids(params))
+        if removed and playlist.name == self.current_playlist:
+            self._removed(removed)
+        elif removed:
+            self.store.remove_entries(node.node_id for node in removed)
+            self._save_playlists()
+        return {'playlist': playlist.name, 'removed': len(removed)}
+
     # ---------- Persistence ----------
     def _save_playlists(self):
+        """Debounce: mutations are already queued on the store; write them in one go shortly"""
+        if not self.save_scheduled:
+            self.save_scheduled = True
+            self.root.after(SAVE_DEBOUNCE_MS, self._flush_store)
+
+    def _flush_store(self):
+        self.save_scheduled = False
         try:
-            save_data = {}
-            for name, playlist in self.playlists.items():
-                songs = []
-                for node in playlist.original_order:
-                    if node and node.song and os.path.exists(node.song.filepath):
-                        songs.append(node.song.filepath)
-                save_data[name] = {
-                    'songs': songs,
-                    'is_shuffled': playlist.is_shuffled
-                }
-            with open('playlists.pkl', 'wb') as f:
-                pickle.dump(save_data, f)
+            self.store.flush()
         except Exception as e:
             messagebox.showerror("Save Error", f"Could not save playlists:\n{str(e)}")
 
+    def _finish_startup(self):
+        """Runs once the window is up: record time-to-first-frame, then read the playlist index"""
+        self.root.update_idletasks()
+        self.first_frame_ms = (time.perf_counter() - LAUNCH_TIME) * 1000
+        self._load_playlists()
+        self._update_playlist_dropdown()
+        self._update_shuffle_button_state()
+        self._poll_folders()
+        self._start_remote()
+        if self.smart_rules:
+            self._build_library()
+        self.root.after(ANALYSIS_DELAY_MS, self._analyze_loudness)
+        count = self.playlist_info.get(self.current_playlist, {}).get('count', 0)
+        self.status_var.set(f"Ready in {self.first_frame_ms:.0f} ms"
+                            + (f" | {self.current_playlist} ({count} songs)" if self.current_playlist else ""))
+
     def _load_playlists(self):
         try:
-            with open('playlists.pkl', 'rb') as f:
-                save_data = pickle.load(f)
-            for name, data in save_data.items():
-                if isinstance(data, list):
-                    songs = data
-                    is_shuffled = False
-                else:
-                    songs = data.get('songs', [])
-                    is_shuffled = data.get('is_shuffled', False)
-                self.playlists[name] = Playlist(name)
-                for path in songs:
-                    if os.path.exists(path):
-                        try:
-                            self.playlists[name].add_song(Song(path))
-                        except Exception:
-                            continue
-                if is_shuffled and self.playlists[name].length > 1:
-                    self.playlists[name].shuffle()
+            self.store = PlaylistStore()
+            self.store.migrate_pickle()
+            PlaylistNode.reserve_ids(self.store.max_entry_id())
+            # Only names and counts are read here; songs are built when a playlist is first shown
+            for name, is_shuffled, song_count in self.store.summaries():
+                self.playlists[name] = None
+                self.playlist_info[name] = {'count': song_count, 'is_shuffled': is_shuffled}
+            self.smart_rules = {name: SmartRules.parse(rules) for name, rules in self.store.smart_playlists().items()}
             if self.playlists:
                 self.current_playlist = next(iter(self.playlists))
-        except (FileNotFoundError, EOFError):
-            pass
         except Exception as e:
             messagebox.showerror("Load Error", f"Could not load playlists:\n{str(e)}")
 
+    def _save_metadata_cache(self):
+        try:
+            metadata_cache.save()
+        except OSError:
+            pass
+
     def _on_close(self):
         try:
-            self._save_playlists()
-            mixer.music.stop()
-            mixer.quit()
-            pygame.quit()
+            if self.remote is not None:
+                self.remote.stop()
+                self.remote = None
+            self._cancel_imports()
+            if self.folder_poll_job is not None:
+                self.root.after_cancel(self.folder_poll_job)
+            if self.loudness is not None:
+                self.loudness.shutdown()
+            self._count_play()
+            if self.store:
+                self.store.close()
+            self._save_metadata_cache()
+            self.import_executor.shutdown(wait=False, cancel_futures=True)
+            self.prefetcher.shutdown()
+            if self.crossfade_job is not None:
+                self.root.after_cancel(self.crossfade_job)
+            if mixer is not None:
+                if self.crossfader is not None:
+                    self.crossfader.stop()
+                mixer.music.stop()
+                mixer.quit()
+                pygame.quit()
         except Exception:
             pass
         finally:
@@ -762,6 +2355,11 @@ class MusicPlayerApp:
 
 # ===================== Run App =====================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Music playlist player")
+    parser.add_argument('--remote', type=int, nargs='?', const=REMOTE_PORT, metavar='PORT',
+                        help=f"serve the remote-control API on 127.0.0.1 (default port {REMOTE_PORT})")
+    parser.add_argument('--remote-socket', metavar='PATH', help="serve the remote-control API on a Unix socket")
+    args = parser.parse_args()
     root = tk.Tk()
-    app = MusicPlayerApp(root)
+    app = MusicPlayerApp(root, remote_port=args.remote, remote_socket=args.remote_socket)
     root.mainloop()
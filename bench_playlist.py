@@ -0,0 +1,232 @@
+"""Benchmark the headless playlist engine on synthetic libraries.
+
+    python bench_playlist.py                    # 1k, 10k and 100k songs
+    python bench_playlist.py --sizes 1000 5000 --repeat 5
+    python bench_playlist.py --loudness ~/Music   # loudness analysis throughput on real files
+
+Songs are synthetic (fixed duration, no files), so the numbers measure the
+data structures and the SQLite store, not the disk or the audio stack.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import playlist_engine
+from playlist_engine import (
+    AUDIO_EXTENSIONS, FEATURE_NAMES, LibraryIndex, LoudnessAnalyzer, MetadataCache, Playlist, PlaylistStore,
+    SearchIndex, SimilarityIndex, SmartPlaylist, SmartRules, Song, numpy_available, song_attributes,
+)
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+OPS_PER_RUN = 1000  # point operations (insert/remove/move) timed per run
+RADIO_QUERIES = 100
+
+
+def synthetic_songs(n):
+    songs = []
+    for i in range(n):
+        album = i // 12  # 12 tracks per album, 5 albums per artist
+        song = Song(f"/music/Artist {album // 5}/Album {album}/{i % 12 + 1:02d} - Track {i:06d}.mp3",
+                    duration=180 + i % 240)
+        song.artist = f"Artist {album // 5}"
+        song.album = f"Album {album}"
+        songs.append(song)
+    return songs
+
+
+def build_playlist(songs):
+    playlist = Playlist("bench")
+    for song in songs:
+        playlist.add_song(song)
+    return playlist
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def measure_memory(n):
+    """Return {component: bytes per track} for n songs in one playlist with a search index"""
+    tracemalloc.start()
+    songs = synthetic_songs(n)
+    after_songs = tracemalloc.get_traced_memory()[0]
+    playlist = build_playlist(songs)
+    after_playlist = tracemalloc.get_traced_memory()[0]
+    index = SearchIndex()
+    for node in playlist.iter_nodes():
+        index.add(node.node_id, playlist.name, node.song)
+    after_index = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {
+        'Song': after_songs / n,
+        'Playlist (nodes + order)': (after_playlist - after_songs) / n,
+        'SearchIndex': (after_index - after_playlist) / n,
+        'total': after_index / n,
+    }
+
+
+def bench_size(n, rng, db_dir):
+    """Return {operation: seconds} for one run at library size n"""
+    songs = synthetic_songs(n)
+    results = {}
+    results['add'] = timed(lambda: build_playlist(songs))
+    playlist = build_playlist(songs)
+    extra = synthetic_songs(OPS_PER_RUN)
+
+    def insert():
+        for song in extra:
+            playlist.insert_song(rng.randrange(playlist.length + 1), song)
+    results[f'insert x{OPS_PER_RUN}'] = timed(insert)
+
+    victims = rng.sample(list(playlist.nodes), OPS_PER_RUN)
+    results[f'remove x{OPS_PER_RUN}'] = timed(lambda: [playlist.remove_node(node_id) for node_id in victims])
+
+    movers = rng.sample(list(playlist.nodes), OPS_PER_RUN)
+    targets = [rng.randrange(playlist.length) for _ in movers]
+    results[f'move x{OPS_PER_RUN}'] = timed(lambda: [playlist.move_to(node_id, index)
+                                                     for node_id, index in zip(movers, targets)])
+
+    results['get_song_list'] = timed(playlist.get_song_list)
+
+    by_artist = (('artist', False), ('album', False), ('track', False))
+    results['sort (artist, album, track)'] = timed(lambda: playlist.sorted_nodes(by_artist))
+    results['sort (cached view)'] = timed(lambda: playlist.sorted_nodes(by_artist))
+    results['apply sort to queue'] = timed(lambda: playlist.apply_order(playlist.sorted_nodes(by_artist)))
+
+    def play_through():
+        playlist.current = playlist.head
+        for _ in range(playlist.length):
+            playlist.play_next()
+    results['play_next (full pass)'] = timed(play_through)
+
+    def shuffled_play_through():
+        playlist.shuffle()
+        for _ in range(playlist.length):
+            playlist.play_next()
+        playlist.unshuffle()
+    results['shuffle + play_next (full pass)'] = timed(shuffled_play_through)
+
+    db_path = os.path.join(db_dir, f"bench_{n}.db")
+    store = PlaylistStore(db_path)
+
+    def save_all():
+        store.create_playlist(playlist.name)
+        for node in playlist.iter_nodes():
+            store.insert_entry(playlist.name, node)
+        store.flush()
+    results['save (full)'] = timed(save_all)
+
+    def save_moves():
+        for node_id, index in zip(movers, targets):
+            playlist.move_to(node_id, (index * 7) % playlist.length)
+            store.move_entry(playlist.name, playlist.get_node(node_id))
+        store.flush()
+    results[f'save (delta, {OPS_PER_RUN} moves)'] = timed(save_moves)
+    store.close()
+
+    def load():
+        reopened = PlaylistStore(db_path)
+        reopened.summaries()
+        loaded = Playlist(playlist.name)
+        for entry_id, _, path in reopened.entries(playlist.name):
+            loaded.add_song(Song(path, duration=180), entry_id)
+        reopened.close()
+        assert loaded.get_song_list() == playlist.get_song_list()
+    results['load'] = timed(load)
+
+    block = rng.sample(list(playlist.nodes), OPS_PER_RUN)
+    results[f'move_nodes (block of {OPS_PER_RUN})'] = timed(lambda: playlist.move_nodes(block, playlist.length // 2))
+    results[f'remove_nodes (batch of {OPS_PER_RUN})'] = timed(lambda: playlist.remove_nodes(block))
+    results[f'insert_songs (block of {OPS_PER_RUN})'] = timed(lambda: playlist.insert_songs(playlist.length // 3,
+                                                                                              extra))
+
+    library = LibraryIndex()
+    for song_id, song in enumerate(songs, 1):
+        song.song_id = song_id
+        library.set(song_id, song.filepath, dict(song_attributes(song), plays=song_id % 3))
+    by_artist_rules = SmartRules.parse('artist is "Artist 7" and duration < 300')
+    scan_rules = SmartRules.parse('duration < 200 and plays = 0')
+    results['smart members (indexed artist)'] = timed(lambda: library.members(by_artist_rules))
+    results['smart members (full scan)'] = timed(lambda: library.members(scan_rules))
+    smart = SmartPlaylist('smart', scan_rules, library)
+    for song_id in library.members(scan_rules):
+        smart.add_song(songs[song_id - 1])
+    changed = rng.sample(range(1, n + 1), min(n, OPS_PER_RUN))
+
+    def smart_updates():
+        for song_id in changed:
+            library.record_play(song_id, time.time())
+            smart.update(song_id, lambda song_id=song_id: songs[song_id - 1])
+    results[f'smart update x{len(changed)} (plays)'] = timed(smart_updates)
+
+    if numpy_available():
+        paths = [song.filepath for song in songs]
+        features = [[rng.gauss(0, 1) for _ in FEATURE_NAMES] for _ in songs]
+        results['radio index build'] = timed(lambda: SimilarityIndex(paths, features))
+        index = SimilarityIndex(paths, features)
+        seeds = [rng.sample(paths, 3) for _ in range(RADIO_QUERIES)]
+        results[f'radio nearest x{RADIO_QUERIES}'] = timed(lambda: [index.nearest(seed, 3, exclude=seed)
+                                                                    for seed in seeds])
+    return results
+
+
+def bench_loudness(folder):
+    """Analyze every audio file under folder from a cold cache and report tracks per second"""
+    paths = [os.path.join(root, name) for root, _, names in os.walk(folder)
+             for name in names if name.lower().endswith(AUDIO_EXTENSIONS)]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # A throwaway cache, so every file is decoded and the app's cache is left alone
+        playlist_engine.metadata_cache = MetadataCache(os.path.join(cache_dir, 'metadata_cache.pkl'))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            analyzer = LoudnessAnalyzer(executor, paths)
+            while not analyzer.poll():
+                time.sleep(0.05)
+    print(f"loudness: {analyzer.analyzed} track(s) analyzed, {analyzer.failed} failed, "
+          f"{analyzer.elapsed:.1f} s, {analyzer.tracks_per_second:.1f} tracks/s "
+          f"({analyzer.workers} worker processes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="library sizes to test")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per size; the best time is reported")
+    parser.add_argument('--seed', type=int, default=1234, help="random seed for operation positions")
+    parser.add_argument('--loudness', metavar='DIR', help="benchmark loudness analysis on the audio files in DIR")
+    args = parser.parse_args()
+    if args.loudness:
+        bench_loudness(args.loudness)
+        return
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        table = {}
+        for n in args.sizes:
+            for run in range(args.repeat):
+                random.seed(args.seed + run)  # Playlist.shuffle draws from the global RNG
+                for op, seconds in bench_size(n, random.Random(args.seed + run), db_dir).items():
+                    table.setdefault(op, {})
+                    table[op][n] = min(seconds, table[op].get(n, seconds))
+                os.remove(os.path.join(db_dir, f"bench_{n}.db"))
+
+    memory = {}
+    for n in args.sizes:
+        for component, per_track in measure_memory(n).items():
+            memory.setdefault(component, {})[n] = per_track
+
+    width = max(len(name) for name in list(table) + list(memory))
+    print(f"{'operation':<{width}}  " + "  ".join(f"{n:>10,}" for n in args.sizes) + "   (best of %d, ms)" % args.repeat)
+    for op, by_size in table.items():
+        print(f"{op:<{width}}  " + "  ".join(f"{by_size[n] * 1000:>10.1f}" for n in args.sizes))
+    print()
+    print(f"{'memory':<{width}}  " + "  ".join(f"{n:>10,}" for n in args.sizes) + "   (bytes per track)")
+    for component, by_size in memory.items():
+        print(f"{component:<{width}}  " + "  ".join(f"{by_size[n]:>10.0f}" for n in args.sizes))
+
+
+if __name__ == '__main__':
+    main()
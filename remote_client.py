@@ -0,0 +1,207 @@
+"""Command-line client for the player's remote-control API (start the player with --remote).
+
+    python remote_client.py status
+    python remote_client.py search "daft punk"
+    python remote_client.py play --node-id 1234
+    python remote_client.py seek 90
+    python remote_client.py events                      # follow now-playing events until Ctrl+C
+    python remote_client.py bench --clients 200 --requests 50 --path /queue
+
+Every command prints the JSON reply. `bench` opens many keep-alive
+connections at once and reports request latency percentiles.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from urllib.parse import quote
+
+from remote_control import REMOTE_HOST, REMOTE_PORT
+
+
+class RemoteClient:
+    """One keep-alive connection to the remote-control server"""
+    def __init__(self, port=REMOTE_PORT, unix_path=None):
+        self.port = port
+        self.unix_path = unix_path
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        if self.unix_path:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.unix_path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(REMOTE_HOST, self.port)
+        return self
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+    def _send(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        head = f"{method} {path} HTTP/1.1\r\nHost: {REMOTE_HOST}\r\nContent-Length: {len(data)}\r\n"
+        if data:
+            head += "Content-Type: application/json\r\n"
+        self.writer.write((head + "\r\n").encode('latin-1') + data)
+
+    async def _read_head(self):
+        lines = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ', 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    async def request(self, method, path, body=None):
+        """(HTTP status, decoded JSON reply)"""
+        self._send(method, path, body)
+        await self.writer.drain()
+        status, headers = await self._read_head()
+        payload = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        return status, json.loads(payload) if payload else None
+
+    async def events(self):
+        """Yield events from /events as dicts, starting with the current status"""
+        self._send('GET', '/events')
+        await self.writer.drain()
+        status, _ = await self._read_head()
+        if status != 200:
+            raise ConnectionError(f"/events answered {status}")
+        while True:
+            block = (await self.reader.readuntil(b'\n\n')).decode('utf-8')
+            for line in block.splitlines():
+                if line.startswith('data: '):
+                    yield json.loads(line[len('data: '):])
+
+
+def command_request(args):
+    """(method, path, body) for a one-shot command"""
+    if args.command in ('status', 'playlists', 'queue'):
+        return 'GET', f"/{args.command}", None
+    if args.command == 'songs':
+        return 'GET', f"/playlists/{quote(args.playlist, safe='')}?offset={args.offset}&limit={args.limit}", None
+    if args.command == 'search':
+        return 'GET', f"/search?q={quote(args.query, safe='')}&limit={args.limit}", None
+    if args.command == 'play':
+        body = {key: value for key, value in (('playlist', args.playlist), ('node_id', args.node_id),
+                                              ('index', args.index)) if value is not None}
+        return 'POST', '/play', body or None
+    if args.command == 'seek':
+        return 'POST', '/seek', {'seconds': args.seconds}
+    if args.command == 'volume':
+        return 'POST', '/volume', {'volume': args.volume}
+    if args.command == 'add':
+        return 'POST', '/queue/add', {'playlist': args.playlist, 'paths': args.paths, 'index': args.index}
+    if args.command == 'move':
+        return 'POST', '/queue/move', {'playlist': args.playlist, 'node_ids': args.node_ids, 'index': args.index}
+    if args.command == 'remove':
+        return 'POST', '/queue/remove', {'playlist': args.playlist, 'node_ids': args.node_ids}
+    return 'POST', f"/{args.command}", None  # pause, resume, toggle, next, previous, stop
+
+
+async def run_command(args):
+    client = await RemoteClient(args.port, args.socket).connect()
+    try:
+        status, reply = await client.request(*command_request(args))
+    finally:
+        await client.close()
+    print(json.dumps(reply, indent=2, ensure_ascii=False))
+    return 0 if status == 200 else 1
+
+
+async def follow_events(args):
+    client = await RemoteClient(args.port, args.socket).connect()
+    try:
+        async for event in client.events():
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+    finally:
+        await client.close()
+    return 0
+
+
+async def bench(args):
+    """Many clients, each sending its requests back to back on one connection"""
+    latencies = []
+    errors = 0
+
+    async def one_client():
+        nonlocal errors
+        client = await RemoteClient(args.port, args.socket).connect()
+        try:
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                status, _ = await client.request('GET', args.path)
+                latencies.append(time.perf_counter() - start)
+                errors += status != 200
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_client() for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(f"{args.clients} clients x {args.requests} requests of {args.path}: {len(latencies)} in {elapsed:.2f} s "
+          f"({len(latencies) / elapsed:,.0f} req/s), {errors} error(s)")
+    print(f"latency ms: p50 {percentile(0.5):.1f}  p90 {percentile(0.9):.1f}  p99 {percentile(0.99):.1f}  "
+          f"max {latencies[-1] * 1000:.1f}")
+    return 1 if errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=REMOTE_PORT, help=f"server port (default {REMOTE_PORT})")
+    parser.add_argument('--socket', metavar='PATH', help="connect to a Unix socket instead")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('status', 'playlists', 'queue', 'pause', 'resume', 'toggle', 'next', 'previous', 'stop', 'events'):
+        commands.add_parser(name)
+    songs = commands.add_parser('songs', help="list a playlist's songs")
+    songs.add_argument('playlist')
+    songs.add_argument('--offset', type=int, default=0)
+    songs.add_argument('--limit', type=int, default=100)
+    search = commands.add_parser('search', help="search every playlist")
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=100)
+    play = commands.add_parser('play', help="play a song by node id or position (neither: play/resume)")
+    play.add_argument('--playlist')
+    play.add_argument('--node-id', type=int)
+    play.add_argument('--index', type=int)
+    seek = commands.add_parser('seek', help="jump within the playing song")
+    seek.add_argument('seconds', type=float)
+    volume = commands.add_parser('volume', help="set the volume (0 to 1)")
+    volume.add_argument('volume', type=float)
+    add = commands.add_parser('add', help="import files into a playlist")
+    add.add_argument('paths', nargs='+')
+    add.add_argument('--playlist')
+    add.add_argument('--index', type=int)
+    for name in ('move', 'remove'):
+        edit = commands.add_parser(name, help=f"{name} entries by node id")
+        edit.add_argument('node_ids', type=int, nargs='+')
+        edit.add_argument('--playlist')
+        if name == 'move':
+            edit.add_argument('--index', type=int, required=True, help="new position of the first entry")
+    load = commands.add_parser('bench', help="load-test the server with concurrent clients")
+    load.add_argument('--clients', type=int, default=200)
+    load.add_argument('--requests', type=int, default=50, help="requests per client")
+    load.add_argument('--path', default='/status', help="GET endpoint to hit (/queue goes through the UI thread)")
+    args = parser.parse_args()
+
+    runner = {'events': follow_events, 'bench': bench}.get(args.command, run_command)
+    try:
+        return asyncio.run(runner(args))
+    except KeyboardInterrupt:
+        return 0
+    except OSError as e:
+        print(f"Could not reach the player: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
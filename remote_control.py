@@ -0,0 +1,375 @@
+"""Local remote-control API for the player: HTTP/JSON over localhost TCP or a Unix socket.
+
+    GET  /status                         now playing (served without waiting for the UI)
+    GET  /events                         Server-Sent Events: now_playing, paused, resumed, stopped, seeked,
+                                         volume, error (a play that failed after its reply was sent)
+    GET  /playlists
+    GET  /playlists/<name>?offset=&limit=
+    GET  /search?q=&limit=
+    GET  /queue?limit=                   the playing song and what comes next
+    POST /play      {"playlist", "node_id" | "index"}   (empty body: play/resume)
+    POST /pause  /resume  /toggle  /next  /previous  /stop
+    POST /seek      {"seconds"}
+    POST /volume    {"volume": 0..1}
+    POST /queue/add     {"playlist", "paths", "index"?}
+    POST /queue/move    {"playlist", "node_ids", "index"}
+    POST /queue/remove  {"playlist", "node_ids"}
+
+The server runs its own asyncio loop on a daemon thread. Everything that
+touches the player goes through a TkBridge: handlers enqueue a command and
+await its future, and the Tk loop runs queued commands in batches from its
+own timer, so the UI thread never blocks on a client and never shares
+state with the server thread. /status and /events read a snapshot that
+the app publishes on every playback change.
+
+Only local clients are served: the TCP server binds to loopback, requests
+naming another Host (DNS rebinding) or carrying an Origin header (a web
+page) are refused, and POST bodies must be JSON, which browsers can't send
+cross-origin without a preflight this server never answers.
+"""
+import errno
+import json
+import os
+import queue
+import stat
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+REMOTE_HOST = '127.0.0.1'
+REMOTE_PORT = 8765
+REMOTE_BATCH = 256          # commands the Tk loop runs per tick
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1 << 20
+EVENT_BACKLOG = 64          # events buffered per stream before a slow client is disconnected
+EVENT_KEEPALIVE_S = 15
+LOCAL_HOSTS = {'127.0.0.1', 'localhost', '[::1]'}
+
+asyncio = None  # imported when a server starts, so the player doesn't pay for it on every launch
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+               409: 'Conflict', 413: 'Payload Too Large', 415: 'Unsupported Media Type',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+# (method, path) -> bridge command; /playlists/<name> is routed separately
+ROUTES = {
+    ('GET', '/playlists'): 'playlists',
+    ('GET', '/search'): 'search',
+    ('GET', '/queue'): 'queue',
+    ('POST', '/play'): 'play',
+    ('POST', '/pause'): 'pause',
+    ('POST', '/resume'): 'resume',
+    ('POST', '/toggle'): 'toggle',
+    ('POST', '/next'): 'next',
+    ('POST', '/previous'): 'previous',
+    ('POST', '/stop'): 'stop',
+    ('POST', '/seek'): 'seek',
+    ('POST', '/volume'): 'volume',
+    ('POST', '/queue/add'): 'add',
+    ('POST', '/queue/move'): 'move',
+    ('POST', '/queue/remove'): 'remove',
+}
+
+
+class RemoteError(Exception):
+    """A command failure to report to the client with an HTTP status"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class TkBridge:
+    """Hands commands from the server thread to the Tk thread.
+
+    submit() may be called from any thread; drain() runs on the Tk thread
+    (from a root.after timer) and resolves each command's future.
+    """
+    def __init__(self, commands):
+        self.commands = commands  # name -> callable(params) returning a JSON-able result
+        self.inbox = queue.SimpleQueue()
+
+    def submit(self, name, params):
+        future = Future()
+        self.inbox.put((name, params, future))
+        return future
+
+    def drain(self, limit=REMOTE_BATCH):
+        """Run up to `limit` queued commands; returns how many ran"""
+        ran = 0
+        while ran < limit:
+            try:
+                name, params, future = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            ran += 1
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.commands[name](params))
+            except Exception as e:
+                future.set_exception(e)
+        return ran
+
+
+class RemoteServer:
+    """asyncio HTTP/JSON server on a daemon thread; start() returns once it is listening"""
+    def __init__(self, bridge, host=REMOTE_HOST, port=REMOTE_PORT, unix_path=None):
+        self.bridge = bridge
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.loop = None
+        self.server = None
+        self.socket_id = None  # (device, inode) of the Unix socket this server bound
+        self.thread = None
+        self.status = {'state': 'stopped', 'song': None, 'playlist': None, 'position': 0.0, 'duration': 0,
+                       'volume': None, 'time': time.time()}
+        self.subscribers = set()  # asyncio.Queue per /events client
+        self.requests = 0
+        self._started = threading.Event()
+        self._error = None
+
+    # --- Lifecycle ---
+    def start(self):
+        global asyncio
+        import asyncio as asyncio_module
+        asyncio = asyncio_module
+        self.thread = threading.Thread(target=self._run, name='remote-control', daemon=True)
+        self.thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            if self.unix_path:
+                self._remove_stale_socket()
+                self.server = self.loop.run_until_complete(
+                    asyncio.start_unix_server(self._serve, self.unix_path, limit=MAX_HEADER_BYTES))
+                bound = os.lstat(self.unix_path)
+                self.socket_id = (bound.st_dev, bound.st_ino)
+            else:
+                self.server = self.loop.run_until_complete(
+                    asyncio.start_server(self._serve, self.host, self.port, limit=MAX_HEADER_BYTES, backlog=1024))
+                self.port = self.server.sockets[0].getsockname()[1]  # the real port when 0 was asked for
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            return
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        if self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self._shutdown)
+        self.thread.join(timeout=2)
+        if self.socket_id is not None:
+            try:
+                current = os.lstat(self.unix_path)
+            except FileNotFoundError:
+                return
+            # Only our own socket: the path may have been replaced since we bound it
+            if stat.S_ISSOCK(current.st_mode) and (current.st_dev, current.st_ino) == self.socket_id:
+                os.unlink(self.unix_path)
+
+    def _remove_stale_socket(self):
+        """Unlink a socket left behind by a previous run; refuse to touch anything else at the path"""
+        try:
+            mode = os.lstat(self.unix_path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise OSError(errno.EEXIST, "path exists and is not a socket", self.unix_path)
+        os.unlink(self.unix_path)
+
+    def _shutdown(self):
+        self.loop.call_later(0.05, self.loop.stop)  # let the streams see their end marker
+        if self.server is not None:
+            self.server.close()
+        for subscriber in list(self.subscribers):
+            self._end_stream(subscriber)
+
+    # --- Events (called from the Tk thread) ---
+    def publish(self, event, status=None):
+        """Broadcast an event to /events clients; status (if given) becomes the /status snapshot"""
+        if self.loop is None or self.loop.is_closed():
+            return
+        if status is not None:
+            status = dict(status, time=time.time())
+        try:
+            self.loop.call_soon_threadsafe(self._broadcast, event, status)
+        except RuntimeError:
+            pass  # the loop is shutting down
+
+    def _broadcast(self, event, status):
+        if status is not None:
+            self.status = status
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.put_nowait(event)
+            except asyncio.QueueFull:
+                self._end_stream(subscriber)  # too far behind: end it rather than buffer without bound
+
+    def _end_stream(self, subscriber):
+        """Queue the end marker for an /events client, dropping its oldest event if the queue is full"""
+        self.subscribers.discard(subscriber)
+        if subscriber.full():
+            subscriber.get_nowait()
+        subscriber.put_nowait(None)
+
+    def current_status(self):
+        """The last published status, with the position advanced to now while playing"""
+        status = dict(self.status)
+        if status['state'] == 'playing':
+            status['position'] = round(min(status['position'] + time.time() - status['time'], status['duration']), 3)
+        del status['time']
+        return status
+
+    # --- HTTP ---
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                if path == '/events' and method == 'GET':
+                    await self._stream_events(writer, headers)
+                    break
+                status, payload = await self._dispatch(method, path, query, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self._respond(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except RemoteError as e:  # malformed request: answer once and hang up
+            self._respond(writer, e.status, {'error': str(e)}, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+            except (ConnectionError, RuntimeError):
+                pass
+
+    async def _read_request(self, reader):
+        """(method, path, query, headers, body), or None when the client closed the connection"""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise RemoteError(400, "Incomplete request") from None
+            return None
+        except asyncio.LimitOverrunError:
+            raise RemoteError(400, "Request headers too large") from None
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise RemoteError(400, "Malformed request line") from None
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise RemoteError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise RemoteError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        return method.upper(), unquote(url.path).rstrip('/') or '/', dict(parse_qsl(url.query)), headers, body
+
+    def _refuse(self, headers, method, body):
+        """An error message for requests that may come from outside this machine's clients, else None"""
+        if self.unix_path is None:
+            host = headers.get('host', '')
+            host = host.rsplit(':', 1)[0] if not host.endswith(']') else host
+            if host not in LOCAL_HOSTS:
+                return "Only local clients may use this server"
+        if 'origin' in headers:
+            return "Browser requests are not accepted"
+        if method == 'POST' and body and not headers.get('content-type', '').startswith('application/json'):
+            return "POST bodies must be application/json"
+        return None
+
+    async def _dispatch(self, method, path, query, headers, body):
+        self.requests += 1
+        refusal = self._refuse(headers, method, body)
+        if refusal:
+            return 403, {'error': refusal}
+        if path == '/status':
+            return (200, self.current_status()) if method == 'GET' else (405, {'error': "Use GET"})
+        if path.startswith('/playlists/'):
+            command, params = 'songs', dict(query, playlist=path[len('/playlists/'):])
+        else:
+            command = ROUTES.get((method, path))
+            if command is None:
+                known = any(route_path == path for _, route_path in ROUTES)
+                return (405, {'error': f"{method} not allowed here"}) if known else (404, {'error': "No such endpoint"})
+            params = dict(query)
+        if body:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                return 400, {'error': "Body is not valid JSON"}
+            if not isinstance(data, dict):
+                return 400, {'error': "Body must be a JSON object"}
+            params.update(data)
+        try:
+            result = await asyncio.wrap_future(self.bridge.submit(command, params))
+        except RemoteError as e:
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f"{type(e).__name__}: {e}"}
+        return 200, result if result is not None else {'ok': True}
+
+    def _respond(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        writer.write((f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                      "Content-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1') + body)
+
+    async def _stream_events(self, writer, headers):
+        refusal = self._refuse(headers, 'GET', b'')
+        if refusal:
+            self._respond(writer, 403, {'error': refusal}, keep_alive=False)
+            return
+        subscriber = asyncio.Queue(EVENT_BACKLOG)
+        self.subscribers.add(subscriber)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Connection: keep-alive\r\n\r\n")
+            writer.write(self._event_bytes({'type': 'status', **self.current_status()}))
+            await writer.drain()
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), EVENT_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    writer.write(b": keep-alive\n\n")
+                    await writer.drain()
+                    continue
+                if event is None:
+                    break
+                writer.write(self._event_bytes(event))
+                await writer.drain()
+        finally:
+            self.subscribers.discard(subscriber)
+
+    @staticmethod
+    def _event_bytes(event):
+        return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n".encode('utf-8')